@@ -0,0 +1,413 @@
+"""
+Offline benchmark of bgs.py stages using synthetic BGG XML documents.
+
+Every stage is timed separately (XML parsing, cache save/load, catalog snapshot load, game selection, rating,
+ranking, expansion grouping and a query repeated with another playing time) and results can be saved as a JSON
+baseline, to compare later runs against it:
+
+    python3 benchmark.py --games 5000 --save baseline.json
+    python3 benchmark.py --games 5000 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import os.path
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+import bgs
+
+# CONST
+BASELINE_VERSION = 1
+DEFAULT_THRESHOLD = 1.25
+STAGES = ('parse_games', 'parse_collections', 'cache_save', 'cache_load', 'catalog_load', 'collect_games',
+          'rate_our_games', 'rank_all', 'rank_top', 'group_expansions', 'requery')
+
+# SYNTHETIC DATA
+
+
+def generate_catalog(games, expansion_depth, poll_size, seed):
+    """
+    Generate a random games catalog
+
+    :param games: how many games
+    :param expansion_depth: max length of expansion chains (expansion of expansion of ..)
+    :param poll_size: how many number of players are in suggested players polls (last one is a N+ result)
+    :param seed: random seed
+    :return: a dict of game descriptions (dicts)
+    """
+    rnd = random.Random(seed)
+    catalog = {}
+    depth = {}
+    for game_id in range(1, games + 1):
+        player_min = rnd.choice([1, 2, 2, 2, 3, 4])
+        player_max = rnd.choice([player_min, 4, 4, 5, 6, 8, 10, 99])
+        player_max = max(player_min, player_max)
+        game = {
+            'name': 'Synthetic game %d' % game_id,
+            'player_min': player_min,
+            'player_max': player_max,
+            'playing_time': rnd.choice([0, 15, 20, 30, 45, 60, 90, 120, 180, 240]),
+            'expansion_of': [],
+            'poll': None,
+            'users_rated': rnd.choice([3, 50, 200, 1500, 20000]),
+            'average': round(rnd.uniform(3.0, 9.0), 5),
+            'average_weight': round(rnd.uniform(1.0, 5.0), 4)
+        }
+
+        # About a third of games are expansions (of base games or of other expansions)
+        if (game_id > 10) and (rnd.random() < 0.33):
+            base_id = rnd.randint(max(1, game_id - 200), game_id - 1)
+            if depth.get(base_id, 0) < expansion_depth:
+                game['expansion_of'].append(base_id)
+                depth[game_id] = depth.get(base_id, 0) + 1
+                if rnd.random() < 0.1:
+                    game['expansion_of'].append(rnd.randint(1, game_id - 1))
+
+        if rnd.random() < 0.9:
+            top = min(player_max, poll_size)
+            game['poll'] = [(str(n), rnd.randint(0, 40), rnd.randint(0, 40), rnd.randint(0, 40))
+                            for n in range(1, top + 1)]
+            game['poll'].append(('%d+' % top, rnd.randint(0, 10), rnd.randint(0, 10), rnd.randint(0, 10)))
+
+        catalog[game_id] = game
+    return catalog
+
+
+def generate_collections(catalog, players, collection_size, seed):
+    """
+    Generate random player collections
+
+    :param catalog: a games catalog (see generate_catalog)
+    :param players: how many players
+    :param collection_size: how many games in every collection
+    :param seed: random seed
+    :return: a dict of collections (a dict of item descriptions for every username)
+    """
+    rnd = random.Random(seed)
+    collections = {}
+    for p in range(0, players):
+        items = {}
+        for game_id in rnd.sample(sorted(catalog), min(collection_size, len(catalog))):
+            items[game_id] = {
+                'own': rnd.random() < 0.7,
+                'want_to_play': rnd.random() < 0.15,
+                'rating': rnd.choice([None, None, round(rnd.uniform(1.0, 10.0), 1)]),
+                'plays': rnd.choice([0, 0, 1, 2, 5, 20])
+            }
+        collections['player%d' % p] = items
+    return collections
+
+
+def boardgame_xml(catalog, game_ids):
+    """
+    :param catalog: a games catalog (see generate_catalog)
+    :param game_ids: which games
+    :return: a BGG boardgame xml document
+    """
+    xml = ['<?xml version="1.0" encoding="utf-8"?><boardgames termsofuse="https://boardgamegeek.com/xmlapi/termsofuse">']
+    for game_id in game_ids:
+        game = catalog[game_id]
+        xml.append('<boardgame objectid="%d"><yearpublished>2010</yearpublished>' % game_id)
+        xml.append('<minplayers>%d</minplayers><maxplayers>%d</maxplayers><playingtime>%d</playingtime>'
+                   % (game['player_min'], game['player_max'], game['playing_time']))
+        xml.append('<name sortindex="1">Alternative name</name><name primary="true" sortindex="1">%s</name>'
+                   % escape(game['name']))
+        xml.append('<description>%s</description>' % ('Lorem ipsum dolor sit amet. ' * 20))
+        for base_id in game['expansion_of']:
+            xml.append('<boardgameexpansion objectid="%d" inbound="true">Base game</boardgameexpansion>' % base_id)
+        xml.append('<boardgameexpansion objectid="%d">An expansion</boardgameexpansion>' % (game_id + 100000))
+        xml.append('<poll name="language_dependence" title="Language Dependence" totalvotes="1"><results>'
+                   '<result level="1" value="No necessary in-game text" numvotes="1" /></results></poll>')
+        if game['poll'] is not None:
+            xml.append('<poll name="suggested_numplayers" title="User Suggested Number of Players" totalvotes="100">')
+            for number_of_players, best, recommended, not_recommended in game['poll']:
+                xml.append('<results numplayers="%s"><result value="Best" numvotes="%d" />'
+                           '<result value="Recommended" numvotes="%d" /><result value="Not Recommended" numvotes="%d" />'
+                           '</results>' % (number_of_players, best, recommended, not_recommended))
+            xml.append('</poll>')
+        xml.append('<statistics page="1"><ratings><usersrated>%d</usersrated><average>%s</average>'
+                   '<bayesaverage>6.0</bayesaverage><averageweight>%s</averageweight></ratings></statistics>'
+                   % (game['users_rated'], game['average'], game['average_weight']))
+        xml.append('</boardgame>')
+    xml.append('</boardgames>')
+    return ''.join(xml)
+
+
+def collection_xml(catalog, items):
+    """
+    :param catalog: a games catalog (see generate_catalog)
+    :param items: a collection (see generate_collections)
+    :return: a BGG collection xml document
+    """
+    xml = ['<?xml version="1.0" encoding="utf-8" standalone="yes"?>'
+           '<items totalitems="%d" termsofuse="https://boardgamegeek.com/xmlapi/termsofuse">' % len(items)]
+    for game_id, item in items.items():
+        game = catalog[game_id]
+        xml.append('<item objecttype="thing" objectid="%d" subtype="boardgame" collid="%d">' % (game_id, game_id))
+        xml.append('<name sortindex="1">%s</name><yearpublished>2010</yearpublished>' % escape(game['name']))
+        xml.append('<stats minplayers="%d" maxplayers="%d" playingtime="%d" numowned="100"><rating value="%s">'
+                   '<usersrated value="%d" /><average value="%s" /></rating></stats>'
+                   % (game['player_min'], game['player_max'], game['playing_time'],
+                      item['rating'] if item['rating'] is not None else 'N/A', game['users_rated'], game['average']))
+        xml.append('<status own="%d" prevowned="0" fortrade="0" want="0" wanttoplay="%d" wanttobuy="0" wishlist="0" '
+                   'preordered="0" lastmodified="2015-01-01 10:00:00" />' % (item['own'], item['want_to_play']))
+        xml.append('<numplays>%d</numplays></item>' % item['plays'])
+    xml.append('</items>')
+    return ''.join(xml)
+
+# BENCHMARK
+
+
+def measure(run, setup=None, repeat=5):
+    """
+    Time a function
+
+    :param run: function to time (called with setup result, if any)
+    :param setup: optional function called (and not timed) before every run
+    :param repeat: how many runs
+    :return: a dict with min and median seconds
+    """
+    times = []
+    for i in range(0, repeat):
+        args = (setup(), ) if setup is not None else ()
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+def run_benchmark(config, stages=STAGES):
+    """
+    Run every stage
+
+    :param config: benchmark configuration (a dict, see __create_and_parse_arguments)
+    :param stages: which stages
+    :return: a dict of stage results (see measure)
+    """
+    catalog = generate_catalog(config['games'], config['expansion_depth'], config['poll_size'], config['seed'])
+    collections = generate_collections(catalog, config['players'], config['collection'], config['seed'])
+    games_xml = boardgame_xml(catalog, sorted(catalog)).encode('utf-8')
+    collections_xml = dict([(username, collection_xml(catalog, items).encode('utf-8'))
+                            for username, items in collections.items()])
+    repeat = config['repeat']
+    results = {}
+
+    # Parsed data is used by next stages
+    games = bgs.Game.get_games_from_xml(games_xml)
+    players = {}
+    for username, xml in collections_xml.items():
+        players[username] = bgs.Player(username)
+        players[username].games_stats = bgs.Player.get_games_from_xml(xml)
+    now = time.time()
+    for g in games.values():
+        g.updated = now
+    for p in players.values():
+        p.updated = now
+
+    if 'parse_games' in stages:
+        results['parse_games'] = measure(lambda: bgs.Game.get_games_from_xml(games_xml), repeat=repeat)
+
+    if 'parse_collections' in stages:
+        results['parse_collections'] = measure(
+            lambda: [bgs.Player.get_games_from_xml(xml) for xml in collections_xml.values()], repeat=repeat)
+
+    directory = tempfile.mkdtemp(prefix='bgs-benchmark-')
+    try:
+        counter = [0]
+
+        def new_store():
+            counter[0] += 1
+            return bgs.CacheStore(os.path.join(directory, 'save%d.cache' % counter[0]))
+
+        def save(store):
+            store.save_games(games)
+            for p in players.values():
+                store.save_player(p)
+
+        if 'cache_save' in stages:
+            results['cache_save'] = measure(save, new_store, repeat=repeat)
+
+        if 'cache_load' in stages:
+            store = new_store()
+            save(store)
+            results['cache_load'] = measure(
+                lambda: (store.load_games(list(games)), [store.load_player(username) for username in players]),
+                repeat=repeat)
+
+        if 'catalog_load' in stages:
+            filename = os.path.join(directory, 'catalog')
+            bgs.CatalogSnapshot.write(filename, [games[game_id] for game_id in sorted(games)])
+            results['catalog_load'] = measure(lambda: bgs.CatalogSnapshot(filename).load_games(list(games)),
+                                              repeat=repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # Masters use sessions filled with parsed data, so no data is loaded from cache or BGG
+    def new_session():
+        session = bgs.Session()
+        session.add_games(games)
+        session.players.update(players)
+        return session
+
+    # Every stage is timed with a new session (sessions keep score components of previous queries)
+    def new_master(rate=True, collect=True, session=None):
+        master = bgs.Master(player_ttl=None, game_ttl=None, session=session or new_session())
+        master.add_known_players(sorted(players))
+        master.add_guests(config['guests'])
+        if collect:
+            master.use_games_owned_by_these_players(sorted(players))
+        if collect and rate:
+            master.rate_our_games(playing_time=config['time'], weight=config['weight'])
+        return master
+
+    if 'collect_games' in stages:
+        results['collect_games'] = measure(lambda master: master.use_games_owned_by_these_players(sorted(players)),
+                                           lambda: new_master(collect=False), repeat=repeat)
+
+    if 'rate_our_games' in stages:
+        results['rate_our_games'] = measure(
+            lambda master: master.rate_our_games(playing_time=config['time'], weight=config['weight']),
+            lambda: new_master(rate=False), repeat=repeat)
+
+    if 'rank_all' in stages:
+        results['rank_all'] = measure(lambda master: master.get_decision(None, True, detailed=False), new_master,
+                                      repeat=repeat)
+
+    if 'rank_top' in stages:
+        results['rank_top'] = measure(lambda master: master.get_decision(config['limit'], True, detailed=False),
+                                      new_master, repeat=repeat)
+
+    if 'group_expansions' in stages:
+        results['group_expansions'] = measure(lambda master: master.show_your_decision(None, separate_exp=False),
+                                              new_master, repeat=repeat)
+
+    if 'requery' in stages:
+        # Same query with a different playing time, score components of previous queries are reused
+        session = new_session()
+        new_master(session=session).get_decision(None, True, detailed=False)
+        times = iter(range(config['time'] + 1, config['time'] + 1 + repeat))
+
+        def requery(master):
+            master.rate_our_games(playing_time=next(times), weight=config['weight'])
+            master.get_decision(None, True, detailed=False)
+
+        results['requery'] = measure(requery, lambda: new_master(rate=False, session=session), repeat=repeat)
+
+    return results
+
+
+def compare(results, baseline):
+    """
+    Compare results with a baseline
+
+    :param results: a dict of stage results
+    :param baseline: a baseline (see save_baseline)
+    :return: a dict with ratio (min time / baseline min time) of every stage in baseline
+    """
+    ratios = {}
+    for stage, result in results.items():
+        if stage in baseline['results']:
+            ratios[stage] = result['min'] / baseline['results'][stage]['min']
+    return ratios
+
+
+def save_baseline(filename, config, results):
+    """
+    Save results as a JSON baseline
+
+    :param filename: a filename
+    :param config: benchmark configuration
+    :param results: a dict of stage results
+    """
+    with open(filename, 'w') as output:
+        json.dump({
+            'version': BASELINE_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': config,
+            'results': results
+        }, output, indent=2, sort_keys=True)
+
+
+def __create_and_parse_arguments():
+    """
+    This method will create and run an argument parser
+
+    :return: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Offline benchmark of bgs.py stages using synthetic BGG data.')
+    data_group = parser.add_argument_group('Synthetic data')
+    data_group.add_argument('--games', help='How many games in catalog', type=int, default=5000)
+    data_group.add_argument('--players', help='How many BGG players', type=int, default=4)
+    data_group.add_argument('--guests', help='How many guests', type=int, default=1)
+    data_group.add_argument('--collection', help='How many games in every player collection', type=int, default=1500)
+    data_group.add_argument('--expansion-depth', help='Max length of expansion chains', type=int, default=3)
+    data_group.add_argument('--poll-size', help='How many number of players in polls', type=int, default=8)
+    data_group.add_argument('--seed', help='Random seed', type=int, default=1)
+
+    query_group = parser.add_argument_group('Query')
+    query_group.add_argument('-t', '--time', help='Indicative playing time in minutes', type=int, default=60)
+    query_group.add_argument('-w', '--weight', help='Indicative game weight', type=float, default=2.5)
+    query_group.add_argument('-l', '--limit', help='Limit of rank_top stage', type=int, default=10)
+
+    parser.add_argument('-r', '--repeat', help='How many runs for every stage', type=int, default=5)
+    parser.add_argument('-s', '--stages', nargs='+', help='Run only these stages', choices=STAGES, default=STAGES)
+    parser.add_argument('--save', help='Save results as a JSON baseline', metavar='FILE')
+    parser.add_argument('--compare', help='Compare results with a JSON baseline', metavar='FILE')
+    parser.add_argument('--threshold', help='Slowdown ratio considered a regression', type=float,
+                        default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if (args.games <= 0) | (args.players <= 0) | (args.collection <= 0) | (args.repeat <= 0):
+        parser.error('argument --games, --players, --collection & --repeat: values must be positive')
+
+    return args
+
+
+if __name__ == '__main__':
+    arguments = __create_and_parse_arguments()
+    logging.getLogger('BoardGameGeekSuggestion').setLevel(logging.WARNING)
+
+    configuration = dict([(key, getattr(arguments, key)) for key in
+                          ('games', 'players', 'guests', 'collection', 'expansion_depth', 'poll_size', 'seed', 'time',
+                           'weight', 'limit', 'repeat')])
+
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['config'] != configuration:
+            print('Warning: baseline was created with a different configuration')
+
+    results = run_benchmark(configuration, arguments.stages)
+    ratios = compare(results, baseline) if baseline else {}
+
+    print('%-20s %12s %12s %10s' % ('stage', 'min ms', 'median ms', 'ratio'))
+    regressions = []
+    for stage in STAGES:
+        if stage not in results:
+            continue
+        ratio = ''
+        if stage in ratios:
+            ratio = '%.2fx' % ratios[stage]
+            if ratios[stage] > arguments.threshold:
+                ratio += ' !'
+                regressions.append(stage)
+        print('%-20s %12.2f %12.2f %10s' % (stage, results[stage]['min'] * 1000, results[stage]['median'] * 1000,
+                                             ratio))
+
+    if arguments.save:
+        save_baseline(arguments.save, configuration, results)
+
+    if regressions:
+        print('Slower than baseline: %s' % ', '.join(regressions))
+        sys.exit(1)
@@ -22,23 +22,110 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE."""
 
+import time
+
+# Startup is measured from process start, or from here (before any other import) if it is unknown (see STARTUP_BUDGET)
+STARTUP_TIME = time.time()
+
 import argparse
 import urllib
-import time
 import pickle
 import os.path
 import logging
 import math
-import operator
+import heapq
 import sys
+import threading
+import sqlite3
+import json
+import glob
+import random
+import importlib
+import importlib.util
+import functools
+import mmap
+import array
+import bisect
+import struct
+import csv
+import itertools
+import multiprocessing
+import socket
+import zlib
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
 
 # CONST
 COLLECTION_URL = 'http://www.boardgamegeek.com/xmlapi/collection/%s'
+COLLECTION_DELTA_URL = COLLECTION_URL + '?modifiedsince=%s'
+COLLECTION_DELTA_MARGIN = 24 * 60 * 60
+FULL_SYNC_INTERVAL = 7 * 24 * 60 * 60
 BOARDGAME_URL = 'http://www.boardgamegeek.com/xmlapi/boardgame/%s?stats=1'
-ALREADY_DOWNLOADED_PLAYERS = {}
+CACHE_DATABASE = 'bgs.cache'
+OPEN_CACHE_STORES = {}
+CACHE_STORE_LOCK = threading.Lock()
+PLAYER_CACHE_TTL = 24 * 60 * 60
+GAME_CACHE_TTL = 30 * 24 * 60 * 60
+BACKGROUND_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+BACKGROUND_REFRESH = {}
+BACKGROUND_REFRESH_LOCK = threading.Lock()
 REQUEST_DELAY = 2
+MAX_REQUEST_DELAY = 60
+MAX_REQUEST_RETRIES = 10
+MAX_CONNECTION_RETRIES = 2
+CONNECTION_RETRY_DELAY = 1
+REQUEST_DEADLINE = 300
+CONNECT_TIMEOUT = 5
+COLLECTION_TIMEOUT = (CONNECT_TIMEOUT, 20)
+BOARDGAME_TIMEOUT = (CONNECT_TIMEOUT, 30)
+REQUESTS_PER_SECOND = 1.0
+REQUEST_BURST = 2
+REQUEST_PRIORITY_INTERACTIVE = 0
+REQUEST_PRIORITY_PREFETCH = 1
+GAMES_PER_REQUEST = 100
+MAX_CONCURRENT_REQUESTS = 4
+MAX_BATCH_RETRIES = 3
 MIN_VOTES_FOR_SUGGESTION = 10
 MIN_VOTES_FOR_RATING = 100
+SCORE_WEIGHTS = {
+    'score_playing_time': 0.4,
+    'score_weight': 0.4,
+    'suggested_values': 0.2,
+    'players_score': 0.4,
+}
+XML_CHUNK_SIZE = 64 * 1024
+PARSE_PROCESSES = 0
+PARSE_POOLS = {}
+PARSE_POOL_LOCK = threading.Lock()
+SCORE_BOUND_SLACK = 1e-9
+TOP_RANKING_CHUNK = 64
+SESSION_RELOAD_INTERVAL = 5
+SESSION_RELOAD_MARGIN = 60
+SERVER_HOST = '127.0.0.1'
+MAX_QUERY_SIZE = 64 * 1024
+SCORING_ENGINE_MIN_GAMES = 2000
+SCORE_CACHE_SIZE = 8
+PLAYERS_SCORE_MEMO_SIZE = 500000
+PLAYERS_SCORE_MEMO_VERSION = 1
+CATALOG_CHUNK_SIZE = 5000
+FETCH_OWNER = '%s:%d' % (socket.gethostname(), os.getpid())
+FETCH_LEASE = REQUEST_DEADLINE + 60
+FETCH_POLL_INTERVAL = 0.5
+IMPORT_BATCH_SIZE = 1000
+IMPORT_WORKERS = 4
+CSV_COLUMNS = {
+    'game_id': ('id', 'objectid', 'game_id', 'bggid'),
+    'name': ('name', 'primary', 'objectname'),
+    'player_min': ('minplayers', 'min_players'),
+    'player_max': ('maxplayers', 'max_players'),
+    'playing_time': ('playingtime', 'playing_time'),
+    'average_weight': ('averageweight', 'avgweight', 'weight'),
+    'average_rating': ('average', 'avgrating', 'average_rating'),
+    'users_rated': ('usersrated', 'users_rated', 'numvotes'),
+    'is_an_expansion': ('is_expansion', 'is_an_expansion')
+}
+STARTUP_BUDGET = 0.1
 
 # GENERAL FUNCTIONS
 
@@ -88,713 +175,3760 @@ def standardize(value):
     """
     return max(0.0, min(1.0, round(value, 4)))
 
-# CLASSES
 
+def slots_state(state):
+    """
+    Get attributes from a pickle state (old cache files pickled objects with a __dict__, now objects use __slots__)
 
-class GameStats():
+    :param state: a pickle state
+    :return: a dict of attributes
     """
-    Used to store player game statistics
+    if isinstance(state, tuple):
+        attributes = dict(state[0] or {})
+        attributes.update(state[1] or {})
+        return attributes
+    return dict(state or {})
+
+
+def process_start_time():
     """
-    owned = False
-    rating = None
-    play_count = 0
-    want_to_play = False
+    Get when this process started, so startup includes interpreter startup (Linux only, elsewhere startup is measured
+    from the first script import)
 
-    def __init__(self, game_id):
-        self.game_id = game_id
+    :return: process start time (wall time)
+    """
+    try:
+        with open('/proc/self/stat') as stat:
+            # Fields after the process name, start time (in clock ticks after boot) is field 22
+            start_ticks = int(stat.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as uptime:
+            seconds_after_boot = float(uptime.read().split()[0])
+        started = time.time() - (seconds_after_boot - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return STARTUP_TIME
+    return min(started, STARTUP_TIME)
+
+
+def is_expired(timestamp, max_age):
+    """
+    Check if cached data is older than max_age
+
+    :param timestamp: when data was downloaded (or None if unknown)
+    :param max_age: max age in seconds (None to never expire)
+    :return: True if data must be downloaded again, False otherwise
+    """
+    return (max_age is not None) and ((timestamp is None) or (time.time() - timestamp > max_age))
 
 
-class Player():
+def refresh_in_background(kind, ids, refresh, load):
     """
-    Player class
+    Refresh cached data in a background thread. Ids already being refreshed by this process are skipped (they are
+    released when their refresh is done, so stale data can be refreshed again later) and other processes using the
+    script cache don't refresh the same ids at the same time (see fetch_once)
+
+    :param kind: data kind (like player or game)
+    :param ids: a list of ids
+    :param refresh: a callable, called with a list of ids to download (and save to cache)
+    :param load: a callable, called with a list of ids and a time, it returns the set of ids cached after that time
+    """
+    with BACKGROUND_REFRESH_LOCK:
+        keys = []
+        for i in ids:
+            if ((kind, i) not in BACKGROUND_REFRESH) and ((kind, i) not in keys):
+                keys.append((kind, i))
+        if not keys:
+            return
+        future = BACKGROUND_EXECUTOR.submit(fetch_once, kind, [i for _, i in keys], refresh, load)
+        for key in keys:
+            BACKGROUND_REFRESH[key] = future
+
+    def done(f):
+        with BACKGROUND_REFRESH_LOCK:
+            for key in keys:
+                if BACKGROUND_REFRESH.get(key, None) is f:
+                    del BACKGROUND_REFRESH[key]
+        if f.exception() is not None:
+            log().error('Background cache refresh failed', exc_info=f.exception())
+
+    # Callback runs outside the lock (it runs immediately if refresh is already done)
+    future.add_done_callback(done)
+
+
+def wait_background_refresh():
     """
-    games_stats = {}
-    is_guest = False
+    Wait until every pending background refresh is done
+    """
+    with BACKGROUND_REFRESH_LOCK:
+        futures = set(BACKGROUND_REFRESH.values())
 
-    def __init__(self, username, is_guest=False):
-        self.username = username
-        self.is_guest = is_guest
+    if futures:
+        log().info('Waiting for background cache refresh ..')
+        wait(futures)
 
-    @classmethod
-    def load_from_cache(cls, username):
-        """
-        Load a player from cache
 
-        :param username Which player load from disk
-        :return: None if player is not cached, Player instance otherwise
+class Metrics():
+    """
+    Stage timings, counters and peak memory (see --timing and --profile). Metrics are disabled by default and
+    instrumented code only checks the enabled flag, so they cost nothing until a sink is added.
+    A sink is any callable, called with the report (a dict) by emit.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.sinks = []
+        self.__started = None
+        self.__stages = {}
+        self.__counters = {}
+        self.__lock = threading.Lock()
+
+    def enable(self, sink):
         """
-        obj = load_object(username + '.player')
+        Start collecting metrics
 
-        if obj is None:
-            return None
+        :param sink: a callable, called with the report
+        """
+        self.sinks.append(sink)
+        if not self.enabled:
+            self.__started = process_start_time()
+            self.enabled = True
 
-        if isinstance(obj, Player):
-            return obj
-        else:
-            log().warning('Invalid file for username %s' % username)
-            return None
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure a stage (every call of a stage is added to the same entry)
 
-    @classmethod
-    def create_players_group(cls, username_list, use_cache=True):
-        group = []
-        for username in username_list:
-            p = None
+        :param name: stage name
+        """
+        if not self.enabled:
+            yield
+            return
 
-            # Load from cache
-            if use_cache:
-                p = Player.load_from_cache(username)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
 
-            # If not in cache or clear cache directive
-            if p is None:
-                p = Player(username)
+    def record(self, name, seconds):
+        """
+        Add a call of a stage measured elsewhere (like startup, measured before metrics are enabled)
 
-                # Load stats from BGG
-                if p.download_player_stats():
-                    p.save_to_cache()
-                else:
-                    log().error('Cannot load player data for %s, quit' % username)
-                    exit(1)
-            else:
-                log().info('Loaded %s from cache' % username)
+        :param name: stage name
+        :param seconds: how long the call took (wall time)
+        """
+        if not self.enabled:
+            return
+
+        memory = peak_memory()
+        with self.__lock:
+            stage = self.__stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                    'peak_memory_kb': None})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+            if memory is not None:
+                stage['peak_memory_kb'] = max(stage['peak_memory_kb'] or 0, memory)
+
+    def count(self, name, value=1):
+        """
+        Add a value to a counter
 
-            if p:
-                group.append(p)
+        :param name: counter name
+        :param value: value to add
+        """
+        if not self.enabled:
+            return
 
-        return group
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
 
-    def download_player_stats(self):
+    def report(self):
         """
-        Download player stats from BGG
-
-        :return: True if everything is fine, False otherwise
+        :return: a dict with stages, counters and peak memory
+        """
+        with self.__lock:
+            return {
+                'started': self.__started,
+                'seconds': (time.time() - self.__started) if self.__started is not None else 0.0,
+                'peak_memory_kb': peak_memory(),
+                'stages': dict([(name, dict(stage)) for name, stage in self.__stages.items()]),
+                'counters': dict(self.__counters)
+            }
+
+    def emit(self):
+        """
+        Send the report to every sink
         """
-        def get_xml(username):
-            url = COLLECTION_URL % urllib.parse.quote_plus(username)
-            r = requests.get(url, timeout=5)
+        if not self.enabled:
+            return
 
-            log().debug('Request url: %s' % r.url)
+        report = self.report()
+        for sink in self.sinks:
+            try:
+                sink(report)
+            except:
+                log().exception('Cannot send metrics report')
 
-            if r.status_code == requests.codes.ok:
-                return r.text
 
-            if r.status_code != requests.codes.accepted:
-                log().error('Cannot retrieve xml')
-                return None
-            else:
-                log().debug('Got accepted code, retrying after %d second..' % REQUEST_DELAY)
-                time.sleep(REQUEST_DELAY)
-                return get_xml(username)
+METRICS = Metrics()
 
-        def get_games_from_xml(xml):
-            try:
-                soup = BeautifulSoup(xml, 'xml')
-                games = {}
 
-                if soup.errors:
-                    log().error('Cannot fetch player data')
-                    for error in soup.errors.find_all('error'):
-                        log().error('\t%s' % error.message.string)
-                    return None
+def profiled(name):
+    """
+    Decorator, measure every call of a function as a stage (see Metrics)
 
-                for game in soup.find_all('item'):
+    :param name: stage name
+    :return: a decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            with METRICS.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def peak_memory():
+    """
+    Get the peak memory usage of this process
 
-                    if not game.has_attr('objectid'):
-                        log().warning('Missing objectid')
-                        continue
+    :return: peak resident set size in KB (None if not available on this platform)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
 
-                    game_id = int(game['objectid'])
-                    game_stat = GameStats(game_id)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux uses KB, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
 
-                    # Play count
-                    if game.numplays is None:
-                        log().warning('Missing numplays for game with id %d' % game_id)
-                        continue
 
-                    game_stat.play_count = int(game.numplays.string)
+def json_report_sink(filename):
+    """
+    Create a metrics sink that writes the report as JSON
 
-                    if game.status is None:
-                        log().warning('Missing status for game with id %d' % game_id)
-                        continue
+    :param filename: a filename, - for standard error
+    :return: a sink for Metrics.enable
+    """
+    def sink(report):
+        if filename == '-':
+            sys.stderr.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        else:
+            with open(filename, 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+    return sink
 
-                    # Owned
-                    if (game.status.has_attr('own')) & (game.status['own'] == u'1'):
-                        game_stat.owned = True
 
-                    # Want to play
-                    if (game.status.has_attr('wanttoplay')) & (game.status['wanttoplay'] == u'1'):
-                        game_stat.want_to_play = True
+def log_report_sink(report):
+    """
+    A metrics sink that logs how long every stage took (see --timing)
+
+    :param report: a metrics report
+    """
+    log().info('Timing report:')
+    for name, stage in report['stages'].items():
+        log().info('\t%s: %.1f ms (%d calls)' % (name, stage['seconds'] * 1000, stage['calls']))
+    log().info('\ttotal: %.1f ms' % (report['seconds'] * 1000))
 
-                    # Rating
-                    game_rating = game.stats.rating.get('value', 'N/A')
-                    if game_rating != 'N/A':
-                        game_stat.rating = float(game_rating) / 10.0
 
-                    games[game_id] = game_stat
+class LazyLib():
+    """
+    A lib imported on first use, so script starts fast and libs not needed by a query are never imported
+    """
+    def __init__(self, name, missing_message):
+        """
+        :param name: module name
+        :param missing_message: error message if lib is not installed
+        """
+        self.__name = name
+        self.missing_message = missing_message
+        self.__module = None
+        self.__lock = threading.Lock()
 
-                return games
-            except:
-                log().exception("Parsing errors")
-                return None
+    def is_installed(self):
+        """
+        Check if lib can be imported (without importing it)
 
-        if self.username in ALREADY_DOWNLOADED_PLAYERS:
-            self.games_stats = ALREADY_DOWNLOADED_PLAYERS[self.username]
-            log().debug('Player data already downloaded, skip')
+        :return: True if lib is installed
+        """
+        if self.__module is not None:
             return True
+        try:
+            return importlib.util.find_spec(self.__name) is not None
+        except ImportError:
+            return False
 
-        log().info('Dowloading data for player %s ..' % self.username)
-        log().debug('Requesting xml..')
-        player_xml = get_xml(self.username)
+    def __getattr__(self, attribute):
+        with self.__lock:
+            if self.__module is None:
+                try:
+                    with METRICS.stage('import %s' % self.__name):
+                        self.__module = importlib.import_module(self.__name)
+                except ImportError:
+                    raise ImportError(self.missing_message)
+        return getattr(self.__module, attribute)
 
-        if player_xml:
-            log().debug('Parsing xml ..')
-            parsed_games = get_games_from_xml(player_xml)
 
-            if parsed_games is None:
-                return False
+requests = LazyLib('requests', 'Missing Requests lib, use \'pip3 install requests\'')
+etree = LazyLib('lxml.etree', 'Missing lxml lib, use \'pip3 install lxml\'')
+numpy = LazyLib('numpy', 'Missing NumPy lib, use \'pip3 install numpy\'')
 
-            self.games_stats = parsed_games
+# HTTP
 
-            ALREADY_DOWNLOADED_PLAYERS[self.username] = parsed_games
 
-            log().debug('Download Ok')
-            return True
-        else:
-            log().error('Cannot fetch player data')
-            return False
+class TokenBucket():
+    """
+    Used to limit request rate (shared between threads): a request needs a token and tokens are added at a fixed rate
+    """
 
-    def save_to_cache(self):
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = float(capacity)
+        self.__last_update = time.time()
+        self.__lock = threading.Lock()
+
+    def acquire(self, deadline=None):
         """
-        Save player data to cache
+        Block until a token is available
 
-        :return: True if everything is fine, False otherwise
+        :param deadline: give up if a token is not available before this time (or None)
+        :return: True if a token was taken, False otherwise
+        """
+        while True:
+            with self.__lock:
+                now = time.time()
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__last_update) * self.rate)
+                self.__last_update = now
+                if self.__tokens >= 1.0:
+                    self.__tokens -= 1.0
+                    return True
+                delay = (1.0 - self.__tokens) / self.rate
+
+            if (deadline is not None) and (now + delay > deadline):
+                return False
+            time.sleep(delay)
+
+    def release(self):
         """
-        return save_object(self, self.username + '.player')
+        Give back a token (of a request that did not reach the server)
+        """
+        with self.__lock:
+            self.__tokens = min(self.capacity, self.__tokens + 1.0)
 
 
-class Game():
+class HttpTransport():
     """
-    Used to store game information
+    Used to send HTTP requests: connections are kept alive in a pool (so requests to the same host do not pay TCP and
+    TLS setup again), responses are compressed (gzip or deflate) and bodies are streamed.
+    Requests can be sent to another server (like a local fake BGG for tests and benchmarks). Any object with the same
+    get method can replace it as RequestScheduler transport.
     """
-    game_id = None
-    name = None
-    player_min = None
-    player_max = None
-    playing_time = None
-    suggested_players = None
-    is_an_expansion = False
-    expansion_of = None
-    average_weight = None
-    average_rating = None
 
-    def __init__(self, game_id):
-        self.game_id = game_id
+    def __init__(self, pool_size=MAX_CONCURRENT_REQUESTS, base_url=None):
+        self.pool_size = pool_size
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.__session = None
+        self.__lock = threading.Lock()
+
+    def __get_session(self):
+        with self.__lock:
+            if self.__session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['Accept-Encoding'] = 'gzip, deflate'
+                self.__session = session
+            return self.__session
+
+    def get(self, url, timeout):
+        """
+        Send a GET request
 
-    @classmethod
-    def load_games_collection_from_cache(cls, name):
+        :param url: requested url
+        :param timeout: timeout in seconds, or a (connect, read) tuple
+        :return: a streamed response (body is decompressed while it is read)
         """
-        Load a list of Games from cache
+        if self.base_url is not None:
+            parsed_url = urlparse(url)
+            url = self.base_url + parsed_url.path + ('?' + parsed_url.query if parsed_url.query else '')
+        return self.__get_session().get(url, timeout=timeout, stream=True)
 
-        :param name Collection name
-        :return: None on error, a list of Game object otherwise
+    def close(self):
         """
+        Close pooled connections
+        """
+        with self.__lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
 
-        obj = load_object('%s.collection' % name)
-        if obj:
-            if isinstance(obj, dict):
-                for key in obj:
-                    if not isinstance(obj[key], Game):
-                        log().warning('Invalid file for collection %s' % name)
-                        return None
-                return obj
-            else:
-                log().warning('Invalid file for collection %s' % name)
-                return None
-        return None
 
-    @classmethod
-    def download_games_data(cls, game_id_list):
-        def get_xml(game_id_list, retry_count=0):
-            ids = ','.join([str(game_id) for game_id in game_id_list])
-            url = BOARDGAME_URL % ids
-            r = requests.get(url, timeout=30)
+class ScheduledRequest():
+    """
+    Used to store a request waiting in RequestScheduler queue
+    """
+
+    def __init__(self, url, priority, timeout, deadline):
+        self.url = url
+        self.priority = priority
+        self.timeout = timeout
+        self.deadline = deadline
+        self.attempt = 0
+        self.connection_errors = 0
+        self.future = Future()
+
 
-            log().debug('Requesting games xml using %s ..' % r.url)
+class RequestScheduler():
+    """
+    Used to run every BGG request. Requests are run by a pool of workers in priority order (interactive requests
+    before prefetch ones) under a token bucket rate limit. When BGG is busy (202, 429 and 5xx codes) a request is
+    queued again with an exponential (jittered) delay, until its deadline.
+    """
+    RETRY_STATUS_CODES = (202, 429, 500, 502, 503, 504)
+
+    def __init__(self, rate, burst, workers, transport=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.transport = transport or HttpTransport(workers)
+        # Responses are saved to archive (if any), or read from replay archive instead of BGG (if any)
+        self.archive = None
+        self.replay = None
+        self.__threads = []
+        self.__queue = []
+        self.__sequence = 0
+        self.__condition = threading.Condition()
+
+    def fetch(self, url, priority=REQUEST_PRIORITY_INTERACTIVE, timeout=BOARDGAME_TIMEOUT, deadline=REQUEST_DEADLINE):
+        """
+        Schedule a request
+
+        :param url: requested url
+        :param priority: request priority (lower values first)
+        :param timeout: timeout in seconds for a single attempt, or a (connect, read) tuple
+        :param deadline: give up after this number of seconds
+        :return: a Future with the (streamed) response or None on errors
+        """
+        request = ScheduledRequest(url, priority, timeout, time.time() + deadline)
+        self.__push(request, 0.0)
+        return request.future
+
+    def __push(self, request, not_before):
+        with self.__condition:
+            while len(self.__threads) < self.workers:
+                thread = threading.Thread(target=self.__work, name='bgg-request-%d' % len(self.__threads))
+                thread.daemon = True
+                thread.start()
+                self.__threads.append(thread)
+
+            self.__sequence += 1
+            self.__queue.append((request.priority, self.__sequence, not_before, request))
+            self.__condition.notify()
+
+    def __pop(self):
+        with self.__condition:
+            while True:
+                now = time.time()
+                ready = [item for item in self.__queue if item[2] <= now]
+                if ready:
+                    item = min(ready)
+                    self.__queue.remove(item)
+                    return item[3]
+
+                self.__condition.wait(min([item[2] for item in self.__queue]) - now if self.__queue else None)
+
+    def __work(self):
+        while True:
+            request = self.__pop()
+            try:
+                self.__run(request)
+            except:
+                log().exception('Request to %s failed' % request.url)
+                request.future.set_result(None)
+
+    def __run(self, request):
+        if self.replay is not None:
+            response = self.replay.response(request.url)
+            if response is None:
+                log().error('Cannot find %s in archive %s' % (request.url, self.replay.filename))
+                METRICS.count('request_failures')
+            request.future.set_result(response)
+            return
+
+        if not self.bucket.acquire(request.deadline):
+            log().error('Request deadline exceeded for %s' % request.url)
+            METRICS.count('request_failures')
+            request.future.set_result(None)
+            return
+
+        retry_after = None
+        METRICS.count('requests')
+        try:
+            # Only response headers are measured, body is streamed to the xml parser
+            with METRICS.stage('bgg request'):
+                r = self.transport.get(request.url, request.timeout)
+        except requests.RequestException as e:
+            log().debug('Request error for %s: %s' % (request.url, str(e)))
+            METRICS.count('request_errors')
+
+            # Network errors (unreachable host, DNS, timeouts) are retried only a few times, so callers can quickly
+            # fall back to cached data, long backoff is only for a busy BGG
+            if isinstance(e, requests.ConnectionError):
+                self.bucket.release()
+
+            request.connection_errors += 1
+            if request.connection_errors > MAX_CONNECTION_RETRIES:
+                log().error('Cannot connect to %s: %s' % (request.url, str(e)))
+                METRICS.count('request_failures')
+                request.future.set_result(None)
+                return
+
+            self.__push(request, time.time() + CONNECTION_RETRY_DELAY)
+            return
+        else:
+            log().debug('Request url: %s [%d]' % (r.url, r.status_code))
 
             if r.status_code == requests.codes.ok:
-                return r.text
+                request.future.set_result(self.archive.record(request.url, r) if self.archive is not None else r)
+                return
 
-            if r.status_code != requests.codes.accepted:
-                log().error('Cannot retrieve games xml')
+            if r.status_code not in self.RETRY_STATUS_CODES:
+                log().error('Cannot retrieve xml from %s [%d]' % (request.url, r.status_code))
                 log().debug(r.text)
-                return None
-            else:
-                if retry_count < 10:
-                    log.debug('Retry #%d' % retry_count)
-                    time.sleep(2)
-                    return get_xml(game_id_list, retry_count + 1)
-                else:
-                    log().error('Cannot retrieve games xml')
-                    log().debug(r.text)
-                    return None
+                r.close()
+                METRICS.count('request_failures')
+                request.future.set_result(None)
+                return
+
+            retry_after = r.headers.get('Retry-After', None)
+            r.close()
+            METRICS.count('request_busy_responses')
+
+        request.attempt += 1
+        delay = self.backoff(request.attempt, retry_after)
+        if (request.attempt > MAX_REQUEST_RETRIES) or (time.time() + delay > request.deadline):
+            log().error('Cannot retrieve xml from %s, giving up after %d attempts' % (request.url, request.attempt))
+            METRICS.count('request_failures')
+            request.future.set_result(None)
+            return
+
+        log().debug('Retry #%d for %s after %.1f seconds ..' % (request.attempt, request.url, delay))
+        METRICS.count('request_retries')
+        METRICS.count('request_retry_delay_seconds', delay)
+        self.__push(request, time.time() + delay)
+
+    @staticmethod
+    def backoff(attempt, retry_after=None):
+        """
+        Compute delay before a retry (exponential with jitter)
 
-        def get_games_from_xml(xml):
-            soup = BeautifulSoup(xml)
-            games = {}
+        :param attempt: how many attempts were made
+        :param retry_after: value of Retry-After header (or None)
+        :return: delay in seconds
+        """
+        delay = min(MAX_REQUEST_DELAY, REQUEST_DELAY * pow(2, attempt - 1))
+        delay = delay / 2.0 + random.uniform(0.0, delay / 2.0)
 
-            for game in soup.find_all('boardgame'):
-                if not game.has_attr('objectid'):
-                    log.warning('A game does not have and id')
-                    continue
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
 
-                game_id = int(game['objectid'])
-                g = Game(game_id)
+        return delay
 
-                names = game.find_all('name')
-                name = [name.text for name in names if (name.get('primary', 'false') == 'true')]
-                if not name:
-                    log().warning('A game [%d] does not have and name' % game_id)
-                    continue
 
-                g.name = name[0]
-
-                # Players
-                if (game.minplayers is not None) & (int(game.minplayers.string) > 0):
-                    g.player_min = int(game.minplayers.string)
-
-                if (game.maxplayers is not None) & (int(game.maxplayers.string) > 0):
-                    g.player_max = int(game.maxplayers.string)
-
-                if (game.minplayers is not None) & (int(game.playingtime.string) > 0):
-                    g.playing_time = int(game.playingtime.string)
-
-                # Expansions
-                expansion_of = []
-                expansions = game.find_all('boardgameexpansion')
-                for expansion in expansions:
-                    if expansion.get('inbound', 'false') == 'true':
-                        expansion_of_id = int(expansion.get('objectid', None))
-                        if expansion_of_id is not None:
-                            expansion_of.append(expansion_of_id)
-
-                if expansion_of:
-                    g.is_an_expansion = True
-                    g.expansion_of = set(expansion_of)
-
-                # Suggestions
-                polls = game.find_all('poll', {'name': 'suggested_numplayers'})
-                if (len(polls) > 0) & (g.player_max is not None):
-                    poll = polls[0]
-                    suggested_players = {}
-
-                    results = poll.find_all('results')
-                    for result in results:
-                        if result.has_attr('numplayers'):
-                            player_num_string = result['numplayers']
-                            player_nums = []
-                            if '+' in player_num_string:
-                                more_than = 0
-                                try:
-                                    more_than = int(player_num_string.strip('+'))
-                                except:
-                                    log().exception('Cannot convert numplayers string to int')
-                                    continue
-
-                                if g.player_max < (more_than + 1):
-                                    continue
-
-                                player_nums = range(more_than + 1, g.player_max + 1)
-                            else:
-                                try:
-                                    player_nums = [int(player_num_string)]
-                                except:
-                                    log().exception('Cannot convert numplayers string to int')
-                                    continue
-
-                            for option in result.find_all('result'):
-                                if (not option.has_attr('value')) | (not option.has_attr('numvotes')):
-                                    continue
-
-                                value = option['value']
-                                votes = 0
-                                try:
-                                    votes = int(option['numvotes'])
-                                except:
-                                    log().exception('Cannot convert numvotes string to int')
-                                    continue
-
-                                for pn in player_nums:
-                                    if pn not in suggested_players:
-                                        suggested_players[pn] = {}
-                                    suggested_players[pn][value] = suggested_players[pn].get(value, 0) + votes
-                        else:
-                            continue
+class RecordingResponse():
+    """
+    Used to save a response to an archive while it is read: body is compressed chunk by chunk and saved only if it is
+    completely read
+    """
+    def __init__(self, archive, url, response):
+        self.archive = archive
+        self.url = url
+        self.response = response
 
-                    if suggested_players:
-                        g.suggested_players = suggested_players.copy()
-                        # Clean suggestion with few votes
-                        for pn in suggested_players:
-                            all_votes = sum(suggested_players[pn].values())
-                            if all_votes < MIN_VOTES_FOR_SUGGESTION:
-                                g.suggested_players.pop(pn)
-                        if g.suggested_players == {}:
-                            g.suggested_players = None
-
-                if game.statistics and game.statistics.ratings:
-                    # Weight
-                    if game.statistics.ratings.averageweight:
-                        g.average_weight = float(game.statistics.ratings.averageweight.string)
-
-                    # Rating
-                    if game.statistics.ratings.usersrated and game.statistics.ratings.average:
-                        try:
-                            number_of_votes = int(game.statistics.ratings.usersrated.string)
-                            if number_of_votes >= MIN_VOTES_FOR_RATING:
-                                g.average_rating = float(game.statistics.ratings.average.string) / 10.0
-                        except:
-                            log().exception('Cannot retrive game rating')
+    def __bool__(self):
+        return bool(self.response)
 
-                games[game_id] = g
+    def __enter__(self):
+        return self
 
-            return games
+    def __exit__(self, *args):
+        self.response.close()
 
-        xml = get_xml(game_id_list)
-        if xml:
-            return get_games_from_xml(xml)
-        else:
-            return None
+    def iter_content(self, chunk_size):
+        fetched = time.time()
+        compressor = zlib.compressobj()
+        body = []
+        for chunk in self.response.iter_content(chunk_size):
+            body.append(compressor.compress(chunk))
+            yield chunk
 
-    def __repr__(self):
-        return '<Game object with id %s and name %s>' % (str(self.game_id), str(self.name))
+        body.append(compressor.flush())
+        try:
+            self.archive.save(self.url, fetched, b''.join(body))
+        except:
+            log().exception('Cannot archive response of %s' % self.url)
 
-    def __str__(self):
-        return '<Game object with id %s and name %s>' % (str(self.game_id), str(self.name))
 
+class ArchiveResponse():
+    """
+    Used to read an archived response like a (streamed) BGG response
+    """
+    def __init__(self, body):
+        self.body = body
+
+    def __bool__(self):
+        return True
+
+    def __enter__(self):
+        return self
 
-class Master():
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        decompressor = zlib.decompressobj()
+        data = self.body
+        while data:
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+
+class ResponseArchive():
     """
-    The Master class :P (do all the works)
+    Used to keep raw BGG responses (zlib compressed) in a SQLite database, by url and fetch time. An archive can
+    rebuild the cache when parsing changes (see rebuild_cache) and can replace BGG in tests (see --replay).
+    Urls are archived without scheme and host, so an archive does not depend on which BGG address is used.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT NOT NULL,
+            fetched REAL NOT NULL,
+            body BLOB NOT NULL,
+            PRIMARY KEY (url, fetched)
+        );
+        CREATE INDEX IF NOT EXISTS responses_fetched ON responses(fetched);
     """
-    __game_group = []
-    __clear_cache = False
-    __collection_group = []
-    __collection = {}
-    __available_collection = set([])
-    __possible_collection = set([])
-    __evaluations = {}
-    __detailed_evaluations = {}
 
-    def __init__(self, clear_cache=False):
-        self.__clear_cache = clear_cache
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        with self.__lock:
+            self.__connection.executescript(self.SCHEMA)
 
-    def add_known_players(self, username_list):
+    @staticmethod
+    def key(url):
         """
-        This method adds BBG users to game group
+        :param url: an url
+        :return: archived url (path and query)
+        """
+        parsed_url = urlparse(url)
+        return parsed_url.path + ('?' + parsed_url.query if parsed_url.query else '')
 
-        :param username_list: a list of BGG usernames
+    def record(self, url, response):
         """
-        log().info('Adding BGG players ..')
-        self.__game_group = Player.create_players_group(username_list, use_cache=(not self.__clear_cache))
+        :param url: requested url
+        :param response: a streamed response
+        :return: a response saved to this archive once it is read
+        """
+        return RecordingResponse(self, url, response)
 
-    def add_guests(self, number_of_guests):
+    def save(self, url, fetched, body):
         """
-        This method adds guests (not BGG users) to game group
+        Save a response
 
-        :param number_of_guests: how many guests in game group
+        :param url: requested url
+        :param fetched: when response was received
+        :param body: compressed response body
         """
-        log().info('Adding guests ..')
-        for i in range(0, number_of_guests):
-            self.__game_group.append(Player('GUEST_%d' % i, is_guest=True))
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO responses (url, fetched, body) VALUES (?, ?, ?)',
+                                      (self.key(url), fetched, body))
+        METRICS.count('responses_archived')
 
-    def use_games_owned_by_these_players(self, username_list):
+    def response(self, url):
         """
-        This method gather all games owned by a list of BGG users
+        Get the last response of an url
 
-        :param username_list: a list of BGG usernames
+        :param url: requested url
+        :return: None if url is not archived, an ArchiveResponse otherwise
         """
-        log().info('Adding player game collections ..')
-        self.__collection_group = Player.create_players_group(username_list, use_cache=(not self.__clear_cache))
+        with self.__lock:
+            row = self.__connection.execute('SELECT body FROM responses WHERE url = ? ORDER BY fetched DESC LIMIT 1',
+                                            (self.key(url), )).fetchone()
+        return ArchiveResponse(row[0]) if row is not None else None
 
-        # Select only owned games
-        collection_group_games = set([])
-        for player in self.__collection_group:
-            for game_id in player.games_stats:
-                if player.games_stats[game_id].owned:
-                    collection_group_games.add(game_id)
+    def responses(self):
+        """
+        Read every response in fetch order (bodies are read one at a time)
 
-        # Which games must be downloaded
-        missing_games = collection_group_games
+        :return: a generator of (archived url, fetch time, ArchiveResponse)
+        """
+        with self.__lock:
+            keys = self.__connection.execute('SELECT url, fetched FROM responses ORDER BY fetched, url').fetchall()
 
-        if not self.__clear_cache:
-            log().info('Loading games data from cache ..')
-            cached_collection = Game.load_games_collection_from_cache('master')
-            if cached_collection:
-                self.__collection.update(cached_collection)
-                # Remove cached games from missing games
-                missing_games.difference_update(cached_collection.keys())
+        for url, fetched in keys:
+            with self.__lock:
+                row = self.__connection.execute('SELECT body FROM responses WHERE url = ? AND fetched = ?',
+                                                (url, fetched)).fetchone()
+            yield url, fetched, ArchiveResponse(row[0])
 
-        if missing_games:
-            log().info('Downloading games data from BGG ..')
-            self.__collection.update(Game.download_games_data(missing_games))
 
-        # Check if we have at least one game
-        if self.__collection:
-            log().debug('Saving collection ..')
-            save_object(self.__collection, 'master.collection')
-        else:
-            log().error('Cannot find games in given collections, exit')
-            exit()
+BGG_SCHEDULER = RequestScheduler(REQUESTS_PER_SECOND, REQUEST_BURST, MAX_CONCURRENT_REQUESTS)
 
-    def rate_our_games(self, playing_time=None, weight=None):
-        """
-        This method rate every playable games
+# XML FUNCTIONS
 
-        :param playing_time: desired playing time (or None)
-        :param weight: desired game weight (or None)
-        """
-        # Select only owned games (cache can contain games owned by other people)
-        for game_id in self.__collection:
-            if any([player.games_stats[game_id].owned for player in self.__collection_group if (game_id in player.games_stats)]):
-                self.__available_collection.add(game_id)
 
-        if not self.__available_collection:
-            log().error('No available games, check usernames and/or collections for owned games')
-            exit()
+def iter_xml_elements(xml, tags):
+    """
+    Parse a xml document incrementally and yield every complete element with one of the given tags.
+    Yielded elements (and what comes before them) are cleared once the caller asks for the next one,
+    so memory usage does not depend on the document size.
 
-        # Select only playable games
-        number_of_players = len(self.__game_group)
-        for game_id in self.__available_collection:
-            g = self.__collection[game_id]
+    :param xml: the xml document (str or bytes) or an iterable of its chunks
+    :param tags: a tuple of tag names
+    :return: a generator of lxml elements
+    """
+    # A document is fed in chunks (lxml refuses a single huge chunk)
+    if isinstance(xml, (str, bytes)):
+        xml = [xml[i:i + XML_CHUNK_SIZE] for i in range(0, len(xml), XML_CHUNK_SIZE)]
 
-            # Check number of players
-            if (g.player_min is not None) & (g.player_max is not None):
-                if number_of_players not in range(g.player_min, g.player_max + 1):
-                    continue
+    parser = etree.XMLPullParser(events=('end', ), tag=tags, resolve_entities=False)
 
-            # Check if we own base game of expansions
-            if g.is_an_expansion:
-                if all([(base_id not in self.__available_collection) for base_id in g.expansion_of]):
-                    continue
+    def read_events():
+        for event, element in parser.read_events():
+            yield element
 
-            self.__possible_collection.add(game_id)
+            # Clear processed element and its already processed siblings
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
 
-        # If no game is possible
-        if not self.__possible_collection:
-            log().error('No possible games for this game group, sorry')
-            exit()
-
-        # Begin rating calculation
-        score_weights = {
-            'score_playing_time': 0.4,
-            'score_weight': 0.4,
-            'suggested_values': 0.2,
-            'players_score': 0.4,
-        }
-        scores = {}
-        for game_id in self.__possible_collection:
-            g = self.__collection[game_id]
-            self.__detailed_evaluations[game_id] = {}
-
-            # GENERAL
-
-            # Playing time
-            scores['score_playing_time'] = [0.0, 0.0]
-            if weight:
-                scores['score_playing_time'] = [0.5, score_weights['score_playing_time']]
-                self.__detailed_evaluations[game_id]['score_playing_time'] = ['Default', score_weights['score_playing_time']]
-
-            if (g.playing_time is not None) & (playing_time is not None):
-                delta_time = abs(playing_time - g.playing_time)
-                max_delta = playing_time  # (-T < t < 2T )
-                if delta_time >= max_delta:
-                    scores['score_playing_time'] = [0.0, score_weights['score_playing_time']]
-                else:
-                    raw_score = delta_time * (3.0 / max_delta) + 2.0
-                    scores['score_playing_time'] = [1.0 - (pow(2, raw_score) - 4.0) / 28.0, score_weights['score_playing_time']]
-                self.__detailed_evaluations[game_id]['score_playing_time'] = scores['score_playing_time']
+    for chunk in xml:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        parser.feed(chunk)
+        for element in read_events():
+            yield element
 
-            # Weight
-            scores['score_weight'] = [0.0, 0.0]
-            if weight:
-                scores['score_weight'] = [0.5, score_weights['score_weight']]
-                self.__detailed_evaluations[game_id]['score_weight'] = ['Default', score_weights['score_weight']]
-
-            if (g.average_weight is not None) & (weight is not None):
-                delta_weight = abs(weight - g.average_weight)
-                max_delta = 2.5
-                if delta_weight >= max_delta:
-                    scores['score_weight'] = [0.0, score_weights['score_weight']]
-                else:
-                    raw_score = delta_weight * (2.0 / max_delta) + 2.0
-                    scores['score_weight'] = [1.0 - (pow(2, raw_score) - 4.0) / 16.0, score_weights['score_weight']]
-                self.__detailed_evaluations[game_id]['score_weight'] = scores['score_weight']
-
-            # BGG user suggested number of player
-            scores['suggested_values'] = [0.6, score_weights['suggested_values']]
-            self.__detailed_evaluations[game_id]['suggested_values'] = ['Default', score_weights['suggested_values']]
-            if g.suggested_players:
-                suggested_values = g.suggested_players.get(number_of_players, None)
-                if suggested_values:
-                    suggested_max_score = sum(suggested_values.values())
-                    score_suggestion = suggested_values['Not Recommended'] * 0.5 / suggested_max_score
-                    score_suggestion += suggested_values['Best'] * 1.0 / suggested_max_score
-                    score_suggestion += suggested_values['Recommended'] * 0.5 / suggested_max_score
-                    score_suggestion -= suggested_values['Not Recommended'] * 0.5 / suggested_max_score
-                    scores['suggested_values'] = [max(0.0, score_suggestion), score_weights['suggested_values']]
-                    self.__detailed_evaluations[game_id]['suggested_values'] = scores['suggested_values']
-
-            # PERSONAL
-
-            # Players score (use average rating + play count + want + user rating)
-            scores['players_score'] = [0.5, score_weights['players_score']]
-            players_score = 0.0
-            divide_by = 0.0
-            if g.average_rating:
-                # This rating is less important compared to game group ratings
-                players_score = g.average_rating * 0.5
-                divide_by = 0.5
-
-            for player in self.__game_group:
-                if player.is_guest:
-                    continue
+    parser.close()
+    for element in read_events():
+        yield element
 
-                if game_id not in player.games_stats:
-                    continue
 
-                stats = player.games_stats[game_id]
+def parse_pool():
+    """
+    Get script default xml parsing pool, games xml documents are parsed by PARSE_PROCESSES worker processes
 
-                partial = players_score  #Hack
-                if stats.want_to_play:
-                    if stats.rating:
-                        players_score += 0.8
-                        players_score += stats.rating * 0.2
-                    else:
-                        players_score += 0.9
-                else:
-                    if stats.rating:
-                        if stats.play_count != 0:
-                            players_score += math.exp(stats.play_count / pow(2.0, stats.rating * 10) * -1.0) * stats.rating
-                        else:
-                            players_score += stats.rating * 0.8
-                    else:
-                        continue
+    :return: None if xml is parsed in the calling thread (PARSE_PROCESSES is 0), a process pool otherwise
+    """
+    with PARSE_POOL_LOCK:
+        if PARSE_PROCESSES <= 0:
+            return None
+        if PARSE_PROCESSES not in PARSE_POOLS:
+            # Workers are spawned, forking a process with running threads (requests, background refresh) is unsafe
+            PARSE_POOLS[PARSE_PROCESSES] = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                                               mp_context=multiprocessing.get_context('spawn'))
+        return PARSE_POOLS[PARSE_PROCESSES]
 
-                divide_by += 1.0
 
-                if 'players_score' not in self.__detailed_evaluations[game_id]:
-                    self.__detailed_evaluations[game_id]['players_score'] = {}
-                self.__detailed_evaluations[game_id]['players_score'][player.username] = standardize(players_score - partial)
+def find_first(element, tag):
+    """
+    Find the first descendant of an element with given tag
 
-            if divide_by > 0.0:
-                scores['players_score'] = [players_score / divide_by, score_weights['players_score']]
-                self.__detailed_evaluations[game_id]['all_players_score'] = scores['players_score']
+    :param element: an lxml element
+    :param tag: a tag name
+    :return: an lxml element or None
+    """
+    return next(element.iterdescendants(tag), None)
 
-            # The .-=[ ** SCORE ** ]=-.
-            score_weights_sum = sum([score[1] for score in scores.values()])
-            if score_weights_sum > 0.0:
-                final_score = sum([score[0] * score[1] for score in scores.values()]) / score_weights_sum
-                self.__evaluations[game_id] = standardize(final_score)
-            else:
-                self.__evaluations[game_id] = 0.0
 
-    def show_your_decision(self, limit, separate_exp=False):
-        def build_exp_graph():
-            g = networkx.DiGraph()
-            for game_id in self.__possible_collection:
-                game = self.__collection[game_id]
-                if game.expansion_of:
-                    g.add_node(game_id, pMin=game.player_min, pMax=game.player_max, isBase=(not game.is_an_expansion))
-                    for base_id in game.expansion_of:
-                        if base_id in self.__available_collection:
-                            base = self.__collection[base_id]
-                            g.add_node(base_id, pMin=base.player_min, pMax=base.player_max, isBase=(not base.is_an_expansion))
-                            g.add_edge(base_id, game_id)
-
-            base_to_exp = {}
-            for node, node_data in g.node.items():
-                if not node_data['isBase']:
-                    continue
+def has_content(element):
+    """
+    Check if an element exists and has some content (text or children)
 
-                base_to_exp[node] = []
-                for child, child_data in g.node.items():
-                    if child_data['isBase']:
-                        continue
-                    if networkx.has_path(g, node, child):
-                        for path in list(networkx.all_simple_paths(g, node, child)):
-                            p_max = max([self.__collection[n].player_max for n in path if self.__collection[n].player_max is not None])
-                            p_min = max([self.__collection[n].player_min for n in path if self.__collection[n].player_min is not None])
-                            if p_max and p_min:
-                                if len(self.__game_group) in range(p_min, p_max + 1):
-                                    base_to_exp[node].append(path)
+    :param element: an lxml element or None
+    :return: True if element has content, False otherwise
+    """
+    return (element is not None) and ((len(element) > 0) or bool(element.text))
 
-                # No game with right players
-                if not base_to_exp[node]:
-                    base_to_exp.pop(node)
+# CLASSES
 
-            return base_to_exp, g.node.keys()
 
-        log().info('Game suggestion:')
+class GameStats():
+    """
+    Used to store player game statistics
+    """
+    __slots__ = ('game_id', 'owned', 'rating', 'play_count', 'want_to_play')
 
-        if not separate_exp:
-            max_scores = {}
-            graph, nodes = build_exp_graph()
-            for base, exps in graph.items():
-                if len(exps) == 0:
-                    continue
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.owned = False
+        self.rating = None
+        self.play_count = 0
+        self.want_to_play = False
 
-                exp_max_score = self.__evaluations.get(base, 0.0)
-                for exp in exps:
-                    exp_max_score = max([exp_max_score] + [self.__evaluations[game_id] for game_id in exp if game_id in self.__evaluations])
+    def __setstate__(self, state):
+        self.__init__(None)
+        for attribute, value in slots_state(state).items():
+            if attribute in self.__slots__:
+                setattr(self, attribute, value)
 
-                max_scores[base] = exp_max_score
+    @classmethod
+    def from_xml_element(cls, element):
+        """
+        Create player game statistics from a collection <item> element
 
-            new_eval = self.__evaluations.copy()
-            for game_id in nodes:
-                if game_id not in graph:
-                    new_eval.pop(game_id, None)
-                else:
-                    new_eval[game_id] = max_scores[game_id]
+        :param element: an lxml element
+        :return: None if element is not valid, GameStats instance otherwise
+        """
+        if element.get('objectid') is None:
+            log().warning('Missing objectid')
+            return None
 
-            sorted_evaluation = sorted(new_eval.items(), key=operator.itemgetter(1), reverse=True)
+        game_id = int(element.get('objectid'))
+        game_stat = cls(game_id)
 
-            if limit:
-                sorted_evaluation = sorted_evaluation[:limit]
+        # Play count
+        numplays = find_first(element, 'numplays')
+        if numplays is None:
+            log().warning('Missing numplays for game with id %d' % game_id)
+            return None
 
-            for game_id, score in sorted_evaluation:
-                if game_id in self.__evaluations:
-                    log().info('\t%s [%f]' % (self.__collection[game_id].name, standardize(self.__evaluations[game_id])))
-                    if game_id in self.__detailed_evaluations:
-                        log().debug('\tDetailed evaluation for base game:')
-                        for key in self.__detailed_evaluations[game_id]:
-                            log().debug('\t\t%s = %s' % (key, str(self.__detailed_evaluations[game_id][key])))
-                        log().debug('')
-                else:
-                    log().info('\t%s (you must use an expansion to play this game)' % self.__collection[game_id].name)
+        game_stat.play_count = int(numplays.text)
 
-                if game_id in graph:
-                    exps = set([])
-                    for elist in graph[game_id]:
-                        for e in elist:
-                            exps.add(e)
-                    for e in exps:
-                        if e == game_id:
+        status = find_first(element, 'status')
+        if status is None:
+            log().warning('Missing status for game with id %d' % game_id)
+            return None
+
+        # Owned
+        if status.get('own') == u'1':
+            game_stat.owned = True
+
+        # Want to play
+        if status.get('wanttoplay') == u'1':
+            game_stat.want_to_play = True
+
+        # Rating
+        game_rating = find_first(find_first(element, 'stats'), 'rating').get('value', 'N/A')
+        if game_rating != 'N/A':
+            game_stat.rating = float(game_rating) / 10.0
+
+        return game_stat
+
+
+class Player():
+    """
+    Player class
+    """
+    __slots__ = ('username', 'is_guest', 'games_stats', 'updated', 'full_synced', 'synced_games')
+
+    def __init__(self, username, is_guest=False):
+        self.username = username
+        self.is_guest = is_guest
+        self.games_stats = {}
+        self.updated = None
+        # When the whole collection was downloaded, and which games were downloaded by the last delta sync
+        # (None if it was a full download)
+        self.full_synced = None
+        self.synced_games = None
+
+    def __setstate__(self, state):
+        self.__init__(None)
+        for attribute, value in slots_state(state).items():
+            if attribute in self.__slots__:
+                setattr(self, attribute, value)
+
+    @classmethod
+    @profiled('cache load player')
+    def load_from_cache(cls, username):
+        """
+        Load a player from cache
+
+        :param username Which player load from disk
+        :return: None if player is not cached, Player instance otherwise
+        """
+        try:
+            return cache_store().load_player(username)
+        except:
+            log().exception('Cannot load player %s from cache' % username)
+            return None
+
+    @classmethod
+    def cached_since(cls, username_list, since):
+        """
+        Check which players were saved to cache after a time (like by another process)
+
+        :param username_list: a list of usernames
+        :param since: a time
+        :return: a set of usernames
+        """
+        cached = [cls.load_from_cache(username) for username in username_list]
+        return set([p.username for p in cached if (p is not None) and (p.updated >= since)])
+
+    @classmethod
+    def refresh_players_cache(cls, username_list):
+        """
+        Download stats of some players from BGG and save them to cache (see refresh_cache)
+
+        :param username_list: a list of usernames
+        """
+        for username in username_list:
+            cls(username).refresh_cache()
+
+    @classmethod
+    def create_players_group(cls, username_list, use_cache=True, workers=MAX_CONCURRENT_REQUESTS, max_age=None,
+                             background_refresh=False, loaded_players=None, failed_refreshes=None):
+        """
+        Create a group of players, players not in cache are downloaded at the same time
+
+        :param username_list: a list of BGG usernames
+        :param use_cache: load players from cache (if False every player is downloaded)
+        :param workers: how many players can be downloaded at the same time
+        :param max_age: cached players older than max_age seconds are downloaded again (None to never expire)
+        :param background_refresh: use stale cached players and download them again in background
+        :param loaded_players: a dict of already loaded players (by username), updated with new loaded players
+        :param failed_refreshes: a set of usernames that cannot be downloaded again (their stale cached data is used
+        without trying again), updated with new failed refreshes
+        :return: a list of Player objects, None if some players cannot be loaded
+        """
+        players = {}
+        stale_players = {}
+        for username in username_list:
+            if (username in players) or (username in stale_players):
+                continue
+
+            # Use already loaded players
+            if (loaded_players is not None) and (username in loaded_players):
+                if not loaded_players[username].is_stale(max_age):
+                    log().debug('Using loaded data for %s' % username)
+                    METRICS.count('players_session_hits')
+                    players[username] = loaded_players[username]
+                    continue
+
+            # Load from cache
+            p = None
+            if use_cache:
+                p = Player.load_from_cache(username)
+
+            if p is None:
+                METRICS.count('players_cache_misses')
+                continue
+
+            if p.is_stale(max_age):
+                log().info('Cached data for %s is stale' % username)
+                METRICS.count('players_cache_stale')
+                if (failed_refreshes is not None) and (username in failed_refreshes):
+                    log().debug('Refresh of %s already failed, using cached data' % username)
+                    players[username] = p
+                elif background_refresh:
+                    refresh_in_background('player', [username], Player.refresh_players_cache,
+                                          Player.cached_since)
+                    players[username] = p
+                else:
+                    stale_players[username] = p
+            else:
+                log().info('Loaded %s from cache' % username)
+                METRICS.count('players_cache_hits')
+                players[username] = p
+
+        # If not in cache (or stale) or clear cache directive, load stats from BGG
+        missing_players = []
+        for username in username_list:
+            if (username not in players) and (username not in [p.username for p in missing_players]):
+                missing_players.append(Player(username))
+
+        def download(usernames):
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = dict([(executor.submit(p.download_player_stats, cached=stale_players.get(p.username)), p)
+                                for p in missing_players if p.username in usernames])
+                for future in as_completed(futures):
+                    p = futures[future]
+                    try:
+                        downloaded = future.result()
+                    except:
+                        log().exception('Cannot download player data for %s' % p.username)
+                        downloaded = False
+
+                    if downloaded:
+                        METRICS.count('players_downloaded')
+                        p.save_to_cache()
+                        players[p.username] = p
+
+        # Players downloaded by other processes at the same time are loaded from cache
+        def load(usernames, since):
+            for username in usernames:
+                p = Player.load_from_cache(username)
+                if (p is not None) and (p.updated >= since):
+                    players[username] = p
+            return set(usernames).intersection(players)
+
+        if missing_players:
+            fetch_once('player', [p.username for p in missing_players], download, load)
+
+        failed = []
+        for p in missing_players:
+            if p.username in players:
+                continue
+            elif p.username in stale_players:
+                log().warning('Cannot refresh player data for %s, using cached data' % p.username)
+                players[p.username] = stale_players[p.username]
+                if failed_refreshes is not None:
+                    failed_refreshes.add(p.username)
+            else:
+                log().error('Cannot load player data for %s' % p.username)
+                failed.append(p.username)
+
+        if failed:
+            return None
+
+        if loaded_players is not None:
+            loaded_players.update(players)
+
+        return [players[username] for username in username_list]
+
+    def is_stale(self, max_age):
+        """
+        Check if player data is older than max_age
+
+        :param max_age: max age in seconds (None to never expire)
+        :return: True if player data must be downloaded again, False otherwise
+        """
+        return is_expired(self.updated, max_age)
+
+    def refresh_cache(self):
+        """
+        Download player stats from BGG and save them to cache
+
+        :return: True if everything is fine, False otherwise
+        """
+        if self.download_player_stats(priority=REQUEST_PRIORITY_PREFETCH,
+                                      cached=Player.load_from_cache(self.username)):
+            return self.save_to_cache()
+
+        log().warning('Cannot refresh player data for %s' % self.username)
+        return False
+
+    def set_games_stats(self, games_stats, synced, cached=None):
+        """
+        Set downloaded games stats
+
+        :param games_stats: a dict of GameStats objects
+        :param synced: when games stats were downloaded
+        :param cached: cached Player with the same username if games stats are only changes (delta sync), they are
+        merged into its games stats
+        """
+        if cached is not None:
+            self.games_stats = dict(cached.games_stats)
+            self.games_stats.update(games_stats)
+            self.full_synced = cached.full_synced
+            self.synced_games = set(games_stats)
+        else:
+            self.games_stats = games_stats
+            self.full_synced = synced
+            self.synced_games = None
+        self.updated = synced
+
+    def can_sync_delta(self):
+        """
+        Check if only collection changes since last sync can be downloaded: a delta does not have items removed from
+        the collection, so the whole collection is downloaded again every FULL_SYNC_INTERVAL
+
+        :return: True if a delta sync is possible, False if the whole collection must be downloaded
+        """
+        return (self.updated is not None) and (self.full_synced is not None) and \
+            not is_expired(self.full_synced, FULL_SYNC_INTERVAL)
+
+    def download_player_stats(self, priority=REQUEST_PRIORITY_INTERACTIVE, cached=None):
+        """
+        Download player stats from BGG. If cached data of this player is given (and a delta sync is possible, see
+        can_sync_delta) only collection items modified since its last sync are downloaded and merged into it.
+
+        :param priority: requests priority
+        :param cached: cached Player with the same username (optional)
+        :return: True if everything is fine, False otherwise
+        """
+        def get_xml(username, since):
+            if since is None:
+                url = COLLECTION_URL % urllib.parse.quote_plus(username)
+            else:
+                # BGG takes a date, a margin covers time zones
+                modified_since = time.strftime('%y-%m-%d', time.gmtime(since - COLLECTION_DELTA_MARGIN))
+                url = COLLECTION_DELTA_URL % (urllib.parse.quote_plus(username), modified_since)
+            return BGG_SCHEDULER.fetch(url, priority=priority, timeout=COLLECTION_TIMEOUT).result()
+
+        delta = (cached is not None) and cached.can_sync_delta()
+        if delta:
+            log().info('Dowloading changes for player %s ..' % self.username)
+        else:
+            log().info('Dowloading data for player %s ..' % self.username)
+        log().debug('Requesting xml..')
+        response = get_xml(self.username, cached.updated if delta else None)
+
+        if response:
+            log().debug('Parsing xml ..')
+            with response:
+                parsed_games = Player.get_games_from_xml(response.iter_content(XML_CHUNK_SIZE))
+
+            if parsed_games is None:
+                return False
+
+            if delta:
+                METRICS.count('players_delta_synced')
+                log().debug('%d changed games' % len(parsed_games))
+            self.set_games_stats(parsed_games, time.time(), cached if delta else None)
+
+            log().debug('Download Ok')
+            return True
+        else:
+            log().error('Cannot fetch player data')
+            return False
+
+    @staticmethod
+    @profiled('parse collection xml')
+    def get_games_from_xml(xml):
+        """
+        Parse a BGG collection xml
+
+        :param xml: the xml document (str or bytes) or an iterable of its chunks
+        :return: a dict of GameStats objects or None on errors
+        """
+        try:
+            games = {}
+
+            for element in iter_xml_elements(xml, ('item', 'errors')):
+                if element.tag == 'errors':
+                    log().error('Cannot fetch player data')
+                    for error in element.iterdescendants('error'):
+                        log().error('\t%s' % find_first(error, 'message').text)
+                    return None
+
+                game_stat = GameStats.from_xml_element(element)
+                if game_stat is not None:
+                    games[game_stat.game_id] = game_stat
+
+            METRICS.count('collection_items_parsed', len(games))
+            return games
+        except:
+            log().exception("Parsing errors")
+            return None
+
+    @profiled('cache save player')
+    def save_to_cache(self):
+        """
+        Save player data to cache
+
+        :return: True if everything is fine, False otherwise
+        """
+        try:
+            cache_store().save_player(self)
+            return True
+        except:
+            log().exception('Cannot save player %s to cache' % self.username)
+            return False
+
+
+class PlayerPoll():
+    """
+    Used to store BGG suggested number of players poll: votes are stored for ranges of number of players
+    as tuples (min players, max players, best, recommended, not recommended)
+    """
+    __slots__ = ('ranges', )
+    VALUES = ('Best', 'Recommended', 'Not Recommended')
+
+    def __init__(self, ranges=()):
+        self.ranges = tuple(sorted([tuple(r) for r in ranges]))
+
+    def __bool__(self):
+        return len(self.ranges) > 0
+
+    def __eq__(self, other):
+        return isinstance(other, PlayerPoll) and (self.ranges == other.ranges)
+
+    def __repr__(self):
+        return '<PlayerPoll %s>' % str(self.ranges)
+
+    def votes(self, number_of_players):
+        """
+        :param number_of_players: a number of players
+        :return: a tuple with best, recommended and not recommended votes (None if there are no votes)
+        """
+        for min_players, max_players, best, recommended, not_recommended in self.ranges:
+            if min_players > number_of_players:
+                break
+            if number_of_players <= max_players:
+                return best, recommended, not_recommended
+        return None
+
+    @classmethod
+    def from_votes(cls, votes, min_votes=MIN_VOTES_FOR_SUGGESTION):
+        """
+        Create a poll from votes of (overlapping) ranges, votes of overlapping ranges are added
+
+        :param votes: a list of tuples (min players, max players, best, recommended, not recommended)
+        :param min_votes: number of players with fewer votes are removed
+        :return: a PlayerPoll instance
+        """
+        bounds = sorted(set([v[0] for v in votes] + [v[1] + 1 for v in votes]))
+        ranges = []
+        for min_players, next_min_players in zip(bounds, bounds[1:]):
+            overlapping = [v[2:] for v in votes if (v[0] <= min_players) and (next_min_players - 1 <= v[1])]
+            if not overlapping:
+                continue
+
+            counters = tuple([sum(values) for values in zip(*overlapping)])
+            if sum(counters) < min_votes:
+                continue
+
+            # Merge with previous range if votes are the same
+            if ranges and (ranges[-1][1] == min_players - 1) and (ranges[-1][2:] == counters):
+                ranges[-1] = (ranges[-1][0], next_min_players - 1) + counters
+            else:
+                ranges.append((min_players, next_min_players - 1) + counters)
+
+        return cls(ranges)
+
+    @classmethod
+    def from_dict(cls, suggested_players):
+        """
+        Create a poll from old suggested players (a dict of votes for every number of players)
+
+        :param suggested_players: a dict with number of players as keys and a dict of votes as values
+        :return: a PlayerPoll instance
+        """
+        return cls.from_votes([(players, players) + tuple([values.get(value, 0) for value in cls.VALUES])
+                               for players, values in suggested_players.items()], min_votes=0)
+
+
+class Game():
+    """
+    Used to store game information
+    """
+    __slots__ = ('game_id', 'name', 'player_min', 'player_max', 'playing_time', 'suggested_players',
+                 'is_an_expansion', 'expansion_of', 'average_weight', 'average_rating', 'updated')
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.name = None
+        self.player_min = None
+        self.player_max = None
+        self.playing_time = None
+        self.suggested_players = None
+        self.is_an_expansion = False
+        self.expansion_of = None
+        self.average_weight = None
+        self.average_rating = None
+        self.updated = None
+
+    def __setstate__(self, state):
+        self.__init__(None)
+        for attribute, value in slots_state(state).items():
+            if attribute in self.__slots__:
+                setattr(self, attribute, value)
+
+        # Old cache files have a dict of votes for every number of players
+        if isinstance(self.suggested_players, dict):
+            self.suggested_players = PlayerPoll.from_dict(self.suggested_players) or None
+
+    def is_stale(self, max_age):
+        """
+        Check if game data is older than max_age (partial games imported from a dump are always stale)
+
+        :param max_age: max age in seconds (None to never expire)
+        :return: True if game data must be downloaded again, False otherwise
+        """
+        return (self.updated == 0) or is_expired(self.updated, max_age)
+
+    @classmethod
+    @profiled('cache load games')
+    def load_games_collection_from_cache(cls, game_id_list):
+        """
+        Load a list of Games from cache
+
+        :param game_id_list: a list of BGG game ids
+        :return: None on error, a dict of (cached) Game object otherwise
+        """
+        try:
+            return cache_store().load_games(game_id_list)
+        except:
+            log().exception('Cannot load games from cache')
+            return None
+
+    @classmethod
+    @profiled('cache save games')
+    def save_games_collection_to_cache(cls, games):
+        """
+        Save a list of Games to cache (other cached games are kept)
+
+        :param games: a dict of Game objects
+        :return: True if everything is fine, False otherwise
+        """
+        try:
+            cache_store().save_games(games)
+            return True
+        except:
+            log().exception('Cannot save games to cache')
+            return False
+
+    @classmethod
+    def cached_since(cls, game_id_list, since):
+        """
+        Check which games were saved to cache after a time (like by another process)
+
+        :param game_id_list: a list of BGG game ids
+        :param since: a time
+        :return: a set of game ids
+        """
+        try:
+            updates = cache_store().game_updates(game_id_list)
+        except:
+            log().exception('Cannot load games from cache')
+            return set([])
+        return set([game_id for game_id, updated in updates.items() if updated >= since])
+
+    @classmethod
+    def refresh_games_cache(cls, game_id_list):
+        """
+        Download data of some games from BGG and save them to cache
+
+        :param game_id_list: a list of BGG game ids
+        """
+        cls.download_games_data(game_id_list, on_batch=cls.save_games_collection_to_cache,
+                                priority=REQUEST_PRIORITY_PREFETCH)
+
+    @classmethod
+    def download_games_data(cls, game_id_list, batch_size=GAMES_PER_REQUEST, workers=MAX_CONCURRENT_REQUESTS,
+                            on_batch=None, priority=REQUEST_PRIORITY_INTERACTIVE):
+        """
+        Download games data from BGG
+
+        Game ids are split in batches of batch_size ids, batches are requested by a pool of workers (through
+        BGG_SCHEDULER) and only failed batches are requested again.
+
+        :param game_id_list: a list of BGG game ids
+        :param batch_size: how many games for each request
+        :param workers: how many requests can run at the same time
+        :param on_batch: optional callable, called with the games dict of every downloaded batch
+        :param priority: requests priority
+        :return: a dict of Game objects (it can be partial if some batches cannot be downloaded)
+        """
+        def get_xml(game_id_list):
+            ids = ','.join([str(game_id) for game_id in game_id_list])
+            url = BOARDGAME_URL % ids
+            return BGG_SCHEDULER.fetch(url, priority=priority, timeout=BOARDGAME_TIMEOUT).result()
+
+        def download_batch(batch):
+            try:
+                response = get_xml(batch)
+                if response:
+                    with response:
+                        return Game.parse_games_xml(response.iter_content(XML_CHUNK_SIZE))
+            except:
+                log().exception('Cannot download games batch')
+            return None
+
+        game_id_list = sorted(game_id_list)
+        batches = [game_id_list[i:i + batch_size] for i in range(0, len(game_id_list), batch_size)]
+        games = {}
+
+        for attempt in range(0, MAX_BATCH_RETRIES + 1):
+            if not batches:
+                break
+
+            if attempt > 0:
+                log().info('Retrying %d failed batches ..' % len(batches))
+
+            failed_batches = []
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = {executor.submit(download_batch, batch): batch for batch in batches}
+                for future in as_completed(futures):
+                    batch_games = future.result()
+                    if batch_games is None:
+                        failed_batches.append(futures[future])
+                        continue
+
+                    log().debug('Downloaded batch with %d games' % len(batch_games))
+                    games.update(batch_games)
+                    if on_batch is not None:
+                        on_batch(batch_games)
+
+            # Every batch failed (BGG cannot be reached), retrying is useless
+            if len(failed_batches) == len(batches):
+                break
+            batches = failed_batches
+
+        if batches:
+            log().error('Cannot download data for %d games' % sum([len(batch) for batch in batches]))
+
+        return games
+
+    @staticmethod
+    @profiled('parse games xml')
+    def get_games_from_xml(xml):
+        """
+        Parse a BGG boardgame xml
+
+        :param xml: the xml document (str or bytes) or an iterable of its chunks
+        :return: a dict of Game objects
+        """
+        games = {}
+
+        for element in iter_xml_elements(xml, ('boardgame', )):
+            g = Game.from_xml_element(element)
+            if g is not None:
+                games[g.game_id] = g
+
+        METRICS.count('games_parsed', len(games))
+        return games
+
+    @staticmethod
+    def parse_games_xml(xml):
+        """
+        Parse a BGG boardgame xml, in a worker process if there is a parse pool (see parse_pool).
+        Workers send back game records, so games are the same (and in the same order) as parsed in this process.
+
+        :param xml: the xml document (str or bytes) or an iterable of its chunks
+        :return: a dict of Game objects
+        """
+        pool = parse_pool()
+        if pool is None:
+            return Game.get_games_from_xml(xml)
+
+        if not isinstance(xml, (str, bytes)):
+            xml = b''.join([chunk.encode('utf-8') if isinstance(chunk, str) else chunk for chunk in xml])
+        return Game.get_games_from_records(pool.submit(Game.get_records_from_xml, xml).result())
+
+    @staticmethod
+    def get_records_from_xml(xml):
+        """
+        Parse a BGG boardgame xml (run by parse pool workers)
+
+        :param xml: the xml document (str or bytes) or an iterable of its chunks
+        :return: a list of game records (see Game.to_record)
+        """
+        try:
+            return [g.to_record() for g in Game.get_games_from_xml(xml).values()]
+        except etree.Error as e:
+            # lxml errors cannot be sent back to the parent process
+            raise ValueError('Invalid boardgame xml: %s' % e)
+
+    @staticmethod
+    def get_records_from_xml_file(filename):
+        """
+        Parse a saved BGG boardgame xml file, read in chunks (run by parse pool workers)
+
+        :param filename: a filename
+        :return: a list of game records (see Game.to_record)
+        """
+        with open(filename, 'rb') as xml_file:
+            return Game.get_records_from_xml(iter(functools.partial(xml_file.read, XML_CHUNK_SIZE), b''))
+
+    @staticmethod
+    def get_games_from_records(records):
+        """
+        :param records: a list of game records (see Game.to_record)
+        :return: a dict of Game objects
+        """
+        games = {}
+        for record in records:
+            g = Game.from_record(record)
+            games[g.game_id] = g
+
+        METRICS.count('games_parsed', len(games))
+        return games
+
+    @staticmethod
+    def get_games_from_xml_file(filename):
+        """
+        Parse a saved BGG boardgame xml file (read in chunks), in a worker process if there is a parse pool.
+        Games update time is the file modification time.
+
+        :param filename: a filename
+        :return: a dict of Game objects
+        """
+        pool = parse_pool()
+        if pool is None:
+            with open(filename, 'rb') as xml_file:
+                games = Game.get_games_from_xml(iter(functools.partial(xml_file.read, XML_CHUNK_SIZE), b''))
+        else:
+            games = Game.get_games_from_records(pool.submit(Game.get_records_from_xml_file, filename).result())
+
+        updated = os.path.getmtime(filename)
+        for g in games.values():
+            g.updated = updated
+        return games
+
+    def to_record(self):
+        """
+        :return: a tuple with game data (except update time), smaller and faster to pickle than the game
+        """
+        return (self.game_id, self.name, self.player_min, self.player_max, self.playing_time,
+                self.suggested_players.ranges if self.suggested_players is not None else None, self.is_an_expansion,
+                tuple(sorted(self.expansion_of)) if self.expansion_of is not None else None, self.average_weight,
+                self.average_rating)
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Create a game from a record (see Game.to_record)
+
+        :param record: a tuple
+        :return: a Game instance
+        """
+        g = cls(record[0])
+        g.name, g.player_min, g.player_max, g.playing_time = record[1:5]
+        g.suggested_players = PlayerPoll(record[5]) if record[5] is not None else None
+        g.is_an_expansion = record[6]
+        g.expansion_of = set(record[7]) if record[7] is not None else None
+        g.average_weight, g.average_rating = record[8:10]
+        return g
+
+    @classmethod
+    def from_csv_row(cls, row):
+        """
+        Create a game from a row of a BGG data dump (see CSV_COLUMNS for known columns).
+        A dump lacks some game data (suggested players polls, expansion links and often players and weight), so the
+        game update time is 0: it is downloaded again (see Game.is_stale) the first time it is used.
+
+        :param row: a dict of column values (lowercase column names)
+        :return: None if row is not valid, Game instance otherwise
+        """
+        values = {}
+        for attribute, columns in CSV_COLUMNS.items():
+            for column in columns:
+                if (row.get(column) or '').strip():
+                    values[attribute] = row[column].strip()
+                    break
+
+        if ('game_id' not in values) or ('name' not in values):
+            log().warning('A game row does not have an id or a name')
+            return None
+
+        try:
+            g = cls(int(values['game_id']))
+            g.name = values['name']
+
+            for attribute in ('player_min', 'player_max', 'playing_time'):
+                if (attribute in values) and (int(float(values[attribute])) > 0):
+                    setattr(g, attribute, int(float(values[attribute])))
+
+            if 'average_weight' in values:
+                g.average_weight = float(values['average_weight'])
+
+            if ('average_rating' in values) and \
+                    (int(float(values.get('users_rated', MIN_VOTES_FOR_RATING))) >= MIN_VOTES_FOR_RATING):
+                g.average_rating = float(values['average_rating']) / 10.0
+
+            g.is_an_expansion = values.get('is_an_expansion', '0').lower() not in ('0', 'false', 'no')
+        except ValueError:
+            log().warning('Invalid row for game %s' % values['game_id'])
+            return None
+
+        g.updated = 0
+        return g
+
+    @classmethod
+    def from_xml_element(cls, element):
+        """
+        Create a game from a <boardgame> element
+
+        :param element: an lxml element
+        :return: None if element is not valid, Game instance otherwise
+        """
+        if element.get('objectid') is None:
+            log().warning('A game does not have and id')
+            return None
+
+        game_id = int(element.get('objectid'))
+        g = cls(game_id)
+
+        names = element.iterdescendants('name')
+        name = [''.join(name.itertext()) for name in names if (name.get('primary', 'false') == 'true')]
+        if not name:
+            log().warning('A game [%d] does not have and name' % game_id)
+            return None
+
+        g.name = name[0]
+
+        # Players
+        minplayers = find_first(element, 'minplayers')
+        if (minplayers is not None) and (int(minplayers.text) > 0):
+            g.player_min = int(minplayers.text)
+
+        maxplayers = find_first(element, 'maxplayers')
+        if (maxplayers is not None) and (int(maxplayers.text) > 0):
+            g.player_max = int(maxplayers.text)
+
+        playingtime = find_first(element, 'playingtime')
+        if (playingtime is not None) and (int(playingtime.text) > 0):
+            g.playing_time = int(playingtime.text)
+
+        # Expansions
+        expansion_of = []
+        expansions = element.iterdescendants('boardgameexpansion')
+        for expansion in expansions:
+            if expansion.get('inbound', 'false') == 'true':
+                expansion_of_id = int(expansion.get('objectid', None))
+                if expansion_of_id is not None:
+                    expansion_of.append(expansion_of_id)
+
+        if expansion_of:
+            # Sorted like cached games, so sets built again from records (or cache) have the same iteration order
+            g.is_an_expansion = True
+            g.expansion_of = set(sorted(expansion_of))
+
+        # Suggestions
+        polls = [poll for poll in element.iterdescendants('poll') if poll.get('name') == 'suggested_numplayers']
+        if (len(polls) > 0) and (g.player_max is not None):
+            poll = polls[0]
+            votes = []
+
+            results = poll.iterdescendants('results')
+            for result in results:
+                if result.get('numplayers') is not None:
+                    player_num_string = result.get('numplayers')
+                    if '+' in player_num_string:
+                        more_than = 0
+                        try:
+                            more_than = int(player_num_string.strip('+'))
+                        except:
+                            log().exception('Cannot convert numplayers string to int')
+                            continue
+
+                        if g.player_max < (more_than + 1):
+                            continue
+
+                        player_nums = (more_than + 1, g.player_max)
+                    else:
+                        try:
+                            player_nums = (int(player_num_string), int(player_num_string))
+                        except:
+                            log().exception('Cannot convert numplayers string to int')
+                            continue
+
+                    counters = dict([(value, 0) for value in PlayerPoll.VALUES])
+                    for option in result.iterdescendants('result'):
+                        if (option.get('value') is None) or (option.get('numvotes') is None):
+                            continue
+
+                        value = option.get('value')
+                        if value not in counters:
+                            continue
+
+                        try:
+                            counters[value] += int(option.get('numvotes'))
+                        except:
+                            log().exception('Cannot convert numvotes string to int')
+                            continue
+
+                    votes.append(player_nums + tuple([counters[value] for value in PlayerPoll.VALUES]))
+                else:
+                    continue
+
+            # Number of players with few votes are removed
+            g.suggested_players = PlayerPoll.from_votes(votes) or None
+
+        statistics = find_first(element, 'statistics')
+        ratings = find_first(statistics, 'ratings') if has_content(statistics) else None
+        if has_content(ratings):
+            # Weight
+            averageweight = find_first(ratings, 'averageweight')
+            if has_content(averageweight):
+                g.average_weight = float(averageweight.text)
+
+            # Rating
+            usersrated = find_first(ratings, 'usersrated')
+            average = find_first(ratings, 'average')
+            if has_content(usersrated) and has_content(average):
+                try:
+                    number_of_votes = int(usersrated.text)
+                    if number_of_votes >= MIN_VOTES_FOR_RATING:
+                        g.average_rating = float(average.text) / 10.0
+                except:
+                    log().exception('Cannot retrive game rating')
+
+        return g
+
+    def __repr__(self):
+        return '<Game object with id %s and name %s>' % (str(self.game_id), str(self.name))
+
+    def __str__(self):
+        return '<Game object with id %s and name %s>' % (str(self.game_id), str(self.name))
+
+
+class CacheStore():
+    """
+    Used to cache games and players data in a SQLite database.
+    Every write is a single transaction, so more processes can share the same cache file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            game_id INTEGER PRIMARY KEY,
+            name TEXT,
+            player_min INTEGER,
+            player_max INTEGER,
+            playing_time INTEGER,
+            is_an_expansion INTEGER NOT NULL DEFAULT 0,
+            average_weight REAL,
+            average_rating REAL,
+            updated REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS expansions (
+            game_id INTEGER NOT NULL REFERENCES games(game_id) ON DELETE CASCADE,
+            base_id INTEGER NOT NULL,
+            PRIMARY KEY (game_id, base_id)
+        );
+        CREATE INDEX IF NOT EXISTS expansions_base ON expansions(base_id);
+        CREATE TABLE IF NOT EXISTS polls (
+            game_id INTEGER NOT NULL REFERENCES games(game_id) ON DELETE CASCADE,
+            min_players INTEGER NOT NULL,
+            max_players INTEGER NOT NULL,
+            best INTEGER NOT NULL,
+            recommended INTEGER NOT NULL,
+            not_recommended INTEGER NOT NULL,
+            PRIMARY KEY (game_id, min_players)
+        );
+        CREATE TABLE IF NOT EXISTS players (
+            username TEXT PRIMARY KEY,
+            updated REAL NOT NULL,
+            full_synced REAL
+        );
+        CREATE TABLE IF NOT EXISTS player_games (
+            username TEXT NOT NULL REFERENCES players(username) ON DELETE CASCADE,
+            game_id INTEGER NOT NULL,
+            owned INTEGER NOT NULL,
+            rating REAL,
+            play_count INTEGER NOT NULL,
+            want_to_play INTEGER NOT NULL,
+            PRIMARY KEY (username, game_id)
+        );
+        CREATE INDEX IF NOT EXISTS player_games_game ON player_games(game_id);
+        CREATE TABLE IF NOT EXISTS fetches (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+    """
+    SCHEMA_VERSION = 2
+    MAX_QUERY_IDS = 500
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.RLock()
+
+        is_new = not os.path.exists(filename)
+        self.__connection = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA foreign_keys=ON')
+        with self.__lock:
+            self.__connection.executescript('BEGIN IMMEDIATE;' + self.SCHEMA + 'COMMIT;')
+        self.__migrate()
+
+        if is_new:
+            self.import_pickle_cache(os.path.dirname(os.path.abspath(filename)))
+
+    def __migrate(self):
+        """
+        Upgrade cache created by older versions
+        """
+        with self.transaction() as cursor:
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            if version >= self.SCHEMA_VERSION:
+                return
+
+            # Version 1: suggested players votes are stored as ranges (polls) instead of a row for every vote
+            if cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'suggestions'").fetchone():
+                log().info('Upgrading cache %s ..' % self.filename)
+                suggestions = {}
+                for game_id, players, value, votes in cursor.execute(
+                        'SELECT game_id, players, value, votes FROM suggestions'):
+                    suggestions.setdefault(game_id, {}).setdefault(players, {})[value] = votes
+                cursor.executemany(
+                    'INSERT INTO polls (game_id, min_players, max_players, best, recommended, not_recommended) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(game_id, ) + r for game_id, values in suggestions.items()
+                     for r in PlayerPoll.from_dict(values).ranges])
+                cursor.execute('DROP TABLE suggestions')
+
+            # Version 2: when the whole collection of a player was downloaded (see Player.can_sync_delta)
+            if 'full_synced' not in [row[1] for row in cursor.execute('PRAGMA table_info(players)')]:
+                cursor.execute('ALTER TABLE players ADD COLUMN full_synced REAL')
+
+            cursor.execute('PRAGMA user_version = %d' % self.SCHEMA_VERSION)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run some queries in a single (immediate) transaction
+
+        :return: a cursor
+        """
+        with self.__lock:
+            cursor = self.__connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+            else:
+                cursor.execute('COMMIT')
+            finally:
+                cursor.close()
+
+    def __select(self, query, ids):
+        """
+        Run a query for a list of ids (in chunks)
+
+        :param query: a query with a single '%s' placeholder for ids
+        :param ids: a list of ids
+        :return: a list of rows
+        """
+        rows = []
+        with self.__lock:
+            for i in range(0, len(ids), self.MAX_QUERY_IDS):
+                chunk = ids[i:i + self.MAX_QUERY_IDS]
+                rows.extend(self.__connection.execute(query % ','.join('?' * len(chunk)), chunk).fetchall())
+        return rows
+
+    def load_player(self, username):
+        """
+        Load a player
+
+        :param username: a BGG username
+        :return: None if player is not cached, Player instance otherwise
+        """
+        with self.__lock:
+            row = self.__connection.execute('SELECT updated, full_synced FROM players WHERE username = ?',
+                                            (username, )).fetchone()
+            if row is None:
+                return None
+
+            rows = self.__connection.execute(
+                'SELECT game_id, owned, rating, play_count, want_to_play FROM player_games WHERE username = ?',
+                (username, )).fetchall()
+
+        player = Player(username)
+        player.updated, player.full_synced = row
+        player.games_stats = {}
+        for game_id, owned, rating, play_count, want_to_play in rows:
+            stats = GameStats(game_id)
+            stats.owned = bool(owned)
+            stats.rating = rating
+            stats.play_count = play_count
+            stats.want_to_play = bool(want_to_play)
+            player.games_stats[game_id] = stats
+
+        return player
+
+    def save_player(self, player):
+        """
+        Save (or replace) a player, after a delta sync only games of the delta are replaced
+
+        :param player: a Player object
+        """
+        if player.updated is None:
+            player.updated = time.time()
+
+        if player.synced_games is None:
+            games_stats = player.games_stats.values()
+        else:
+            games_stats = [player.games_stats[game_id] for game_id in player.synced_games]
+
+        with self.transaction() as cursor:
+            cursor.execute('INSERT INTO players (username, updated, full_synced) VALUES (?, ?, ?) '
+                           'ON CONFLICT (username) DO UPDATE SET updated = excluded.updated, '
+                           'full_synced = excluded.full_synced',
+                           (player.username, player.updated, player.full_synced))
+            if player.synced_games is None:
+                cursor.execute('DELETE FROM player_games WHERE username = ?', (player.username, ))
+            cursor.executemany(
+                'INSERT OR REPLACE INTO player_games (username, game_id, owned, rating, play_count, want_to_play) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(player.username, stats.game_id, stats.owned, stats.rating, stats.play_count, stats.want_to_play)
+                 for stats in games_stats])
+
+    def updated_players(self, since):
+        """
+        Find players saved after a given time
+
+        :param since: a timestamp
+        :return: a dict with update time of every player (by username)
+        """
+        with self.__lock:
+            return dict(self.__connection.execute('SELECT username, updated FROM players WHERE updated >= ?',
+                                                  (since, )).fetchall())
+
+    def updated_games(self, since):
+        """
+        Find games saved after a given time
+
+        :param since: a timestamp
+        :return: a dict with update time of every game (by game id)
+        """
+        with self.__lock:
+            return dict(self.__connection.execute('SELECT game_id, updated FROM games WHERE updated >= ?',
+                                                  (since, )).fetchall())
+
+    def cached_game_ids(self, game_id_list):
+        """
+        Check which games are cached
+
+        :param game_id_list: a list of BGG game ids
+        :return: a set of cached game ids
+        """
+        return set([row[0] for row in self.__select('SELECT game_id FROM games WHERE game_id IN (%s)',
+                                                     list(game_id_list))])
+
+    def game_updates(self, game_id_list):
+        """
+        Get when cached games were updated
+
+        :param game_id_list: a list of BGG game ids
+        :return: a dict of update times (only cached games)
+        """
+        return dict(self.__select('SELECT game_id, updated FROM games WHERE game_id IN (%s)', list(game_id_list)))
+
+    def load_games(self, game_id_list):
+        """
+        Load some games
+
+        :param game_id_list: a list of BGG game ids
+        :return: a dict of Game objects (only cached games)
+        """
+        game_id_list = list(game_id_list)
+        games = {}
+
+        for row in self.__select('SELECT game_id, name, player_min, player_max, playing_time, is_an_expansion, '
+                                 'average_weight, average_rating, updated FROM games WHERE game_id IN (%s)',
+                                 game_id_list):
+            g = Game(row[0])
+            g.name, g.player_min, g.player_max, g.playing_time = row[1:5]
+            g.is_an_expansion = bool(row[5])
+            g.average_weight, g.average_rating, g.updated = row[6:9]
+            games[g.game_id] = g
+
+        for game_id, base_id in self.__select('SELECT game_id, base_id FROM expansions WHERE game_id IN (%s)',
+                                              game_id_list):
+            if games[game_id].expansion_of is None:
+                games[game_id].expansion_of = set([])
+            games[game_id].expansion_of.add(base_id)
+
+        polls = {}
+        for row in self.__select('SELECT game_id, min_players, max_players, best, recommended, not_recommended '
+                                 'FROM polls WHERE game_id IN (%s) ORDER BY game_id, min_players', game_id_list):
+            polls.setdefault(row[0], []).append(row[1:])
+        for game_id, ranges in polls.items():
+            games[game_id].suggested_players = PlayerPoll(ranges)
+
+        return games
+
+    def save_games(self, games):
+        """
+        Save (or replace) some games
+
+        :param games: a dict of Game objects
+        """
+        now = time.time()
+        for g in games.values():
+            if g.updated is None:
+                g.updated = now
+
+        with self.transaction() as cursor:
+            cursor.executemany(
+                'INSERT INTO games (game_id, name, player_min, player_max, playing_time, is_an_expansion, '
+                'average_weight, average_rating, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (game_id) DO UPDATE SET name = excluded.name, player_min = excluded.player_min, '
+                'player_max = excluded.player_max, playing_time = excluded.playing_time, '
+                'is_an_expansion = excluded.is_an_expansion, average_weight = excluded.average_weight, '
+                'average_rating = excluded.average_rating, updated = excluded.updated',
+                [(g.game_id, g.name, g.player_min, g.player_max, g.playing_time, g.is_an_expansion,
+                  g.average_weight, g.average_rating, g.updated) for g in games.values()])
+
+            game_ids = [(game_id, ) for game_id in games]
+            cursor.executemany('DELETE FROM expansions WHERE game_id = ?', game_ids)
+            cursor.executemany('DELETE FROM polls WHERE game_id = ?', game_ids)
+            cursor.executemany(
+                'INSERT INTO expansions (game_id, base_id) VALUES (?, ?)',
+                [(g.game_id, base_id) for g in games.values() for base_id in (g.expansion_of or [])])
+            cursor.executemany(
+                'INSERT INTO polls (game_id, min_players, max_players, best, recommended, not_recommended) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(g.game_id, ) + r for g in games.values() if g.suggested_players for r in g.suggested_players.ranges])
+
+    def import_pickle_cache(self, directory):
+        """
+        Import old cache files (<username>.player and master.collection) from a directory
+
+        :param directory: where cache files are
+        """
+        filenames = sorted(glob.glob(os.path.join(directory, '*.player')))
+        collection_filename = os.path.join(directory, 'master.collection')
+        if os.path.exists(collection_filename):
+            filenames.append(collection_filename)
+
+        if filenames:
+            log().info('Importing old cache files into %s ..' % self.filename)
+
+        for filename in filenames:
+            obj = load_object(filename)
+            # Old cache files don't know when data was downloaded, their last write is used (not import time)
+            updated = os.path.getmtime(filename)
+            if isinstance(obj, Player):
+                if obj.updated is None:
+                    obj.updated = updated
+                self.save_player(obj)
+            elif isinstance(obj, dict) and all([isinstance(g, Game) for g in obj.values()]):
+                for g in obj.values():
+                    if g.updated is None:
+                        g.updated = updated
+                self.save_games(obj)
+            else:
+                log().warning('Invalid cache file %s, skip' % filename)
+
+    @staticmethod
+    def __is_active_claim(owner, expires, now):
+        """
+        :param owner: claim owner (host:pid)
+        :param expires: when claim expires
+        :param now: current time
+        :return: False if claim is expired or its owner is a dead process (of this host), True otherwise
+        """
+        if expires < now:
+            return False
+
+        host, _, pid = owner.rpartition(':')
+        if (os.name == 'posix') and (host == socket.gethostname()) and (owner != FETCH_OWNER):
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except (OSError, ValueError):
+                pass
+        return True
+
+    def claim_fetches(self, keys, lease=FETCH_LEASE):
+        """
+        Claim fetches of some keys (like player:<username> or game:<id>), so other processes using this cache do not
+        fetch the same data at the same time. Claims of other threads of this process are active claims too.
+
+        :param keys: a list of keys
+        :param lease: claims expire after lease seconds (if the owner cannot release them)
+        :return: a set of claimed keys (keys with an active claim of someone else are not claimed)
+        """
+        keys = list(keys)
+        now = time.time()
+        with self.transaction() as cursor:
+            taken = set([key for key, owner, expires in self.__select(
+                'SELECT key, owner, expires FROM fetches WHERE key IN (%s)', keys)
+                if self.__is_active_claim(owner, expires, now)])
+            claimed = set(keys).difference(taken)
+            cursor.executemany('INSERT OR REPLACE INTO fetches (key, owner, expires) VALUES (?, ?, ?)',
+                               [(key, FETCH_OWNER, now + lease) for key in claimed])
+        return claimed
+
+    def release_fetches(self, keys):
+        """
+        Release claims of this process
+
+        :param keys: a list of claimed keys
+        """
+        with self.transaction() as cursor:
+            cursor.executemany('DELETE FROM fetches WHERE key = ? AND owner = ?', [(key, FETCH_OWNER) for key in keys])
+
+    def active_fetches(self, keys):
+        """
+        :param keys: a list of keys
+        :return: a set of keys with an active claim
+        """
+        now = time.time()
+        return set([key for key, owner, expires in self.__select(
+            'SELECT key, owner, expires FROM fetches WHERE key IN (%s)', list(keys))
+            if self.__is_active_claim(owner, expires, now)])
+
+    def import_games(self, games):
+        """
+        Save imported games, a cached game is replaced only if it is older or partial (update time 0)
+
+        :param games: a dict of Game objects
+        :return: how many games are saved
+        """
+        updates = self.game_updates(games)
+        games = dict([(game_id, g) for game_id, g in games.items()
+                      if (not updates.get(game_id)) or (updates[game_id] < g.updated)])
+        if games:
+            self.save_games(games)
+        return len(games)
+
+
+def cache_store():
+    """
+    Get script default cache store
+
+    :return: The script cache store
+    """
+    with CACHE_STORE_LOCK:
+        if CACHE_DATABASE not in OPEN_CACHE_STORES:
+            OPEN_CACHE_STORES[CACHE_DATABASE] = CacheStore(CACHE_DATABASE)
+        return OPEN_CACHE_STORES[CACHE_DATABASE]
+
+
+def fetch_once(kind, ids, fetch, load, wait=REQUEST_DEADLINE):
+    """
+    Fetch data once for every process using the script cache: ids being fetched by another process are not fetched
+    again, this process waits for them and loads them from cache. Ids are fetched here if the other process fails.
+
+    :param kind: data kind (like player or game), claims keys are kind:id
+    :param ids: a list of ids
+    :param fetch: a callable, called with a list of ids to fetch (and save to cache)
+    :param load: a callable, called with a list of ids and a time, it loads from cache data updated after that time
+    and returns the set of loaded ids
+    :param wait: max seconds to wait for other processes
+    """
+    store = cache_store()
+    keys = dict([('%s:%s' % (kind, i), i) for i in ids])
+    deadline = time.time() + wait
+    while keys:
+        since = time.time()
+        try:
+            claimed = store.claim_fetches(keys)
+        except:
+            log().exception('Cannot claim fetches, fetching anyway')
+            claimed = set(keys)
+
+        if claimed:
+            try:
+                fetch([keys[key] for key in claimed])
+            finally:
+                try:
+                    store.release_fetches(claimed)
+                except:
+                    log().exception('Cannot release fetches')
+
+        keys = dict([(key, i) for key, i in keys.items() if key not in claimed])
+        if not keys:
+            break
+
+        log().info('Waiting for %d %s fetches of other processes ..' % (len(keys), kind))
+        METRICS.count('%s_fetches_waited' % kind, len(keys))
+        while store.active_fetches(keys) and (time.time() < deadline):
+            time.sleep(FETCH_POLL_INTERVAL)
+
+        loaded = load(list(keys.values()), since)
+        keys = dict([(key, i) for key, i in keys.items() if i not in loaded])
+        if keys and (time.time() >= deadline):
+            fetch(list(keys.values()))
+            break
+
+
+class CatalogSnapshot():
+    """
+    A read-only snapshot of cached games, shared by many processes: the file is memory-mapped (so its pages are shared
+    through the page cache) and Game objects are created only for requested games.
+
+    Games are sorted by id and stored in fixed-width columns (None values are stored as NONE_VALUE or NaN). Names,
+    poll ranges and expansion links are stored in tables, game rows have the offset of their items in every table.
+    """
+    MAGIC = b'BGSCATLG'
+    VERSION = 1
+    HEADER = struct.Struct('<8sII4Q')
+    NONE_VALUE = -2 ** 63
+    IS_AN_EXPANSION = 1
+    HAS_NAME = 2
+    # Column name, array type code and number of items (games count + 1 for offsets)
+    COLUMNS = (('game_id', 'q', 0), ('updated', 'd', 0), ('player_min', 'q', 0), ('player_max', 'q', 0),
+               ('playing_time', 'q', 0), ('average_weight', 'd', 0), ('average_rating', 'd', 0), ('flags', 'B', 0),
+               ('name_offsets', 'Q', 1), ('poll_offsets', 'Q', 1), ('expansion_offsets', 'Q', 1))
+
+    def __init__(self, filename):
+        """
+        Open a snapshot
+
+        :param filename: a snapshot filename (see write)
+        """
+        self.filename = filename
+        with open(filename, 'rb') as input:
+            self.__mmap = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.__mmap)
+
+        magic, version, little_endian, games, polls, expansions, names = self.HEADER.unpack_from(view)
+        if (magic != self.MAGIC) or (version != self.VERSION):
+            raise ValueError('%s is not a catalog snapshot (or it was written by another version)' % filename)
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError('%s was written on a platform with another byte order' % filename)
+
+        offset = self.HEADER.size
+        self.__columns = {}
+        for name, type_code, extra in self.COLUMNS:
+            offset, self.__columns[name] = CatalogSnapshot.__column(view, offset, type_code, games + extra)
+        offset, self.__polls = CatalogSnapshot.__column(view, offset, 'q', polls * 5)
+        offset, self.__expansions = CatalogSnapshot.__column(view, offset, 'q', expansions)
+        self.__names = view[offset:offset + names]
+        self.game_ids = self.__columns['game_id']
+
+    @staticmethod
+    def __column(view, offset, type_code, length):
+        """
+        :return: offset of next column and a memoryview of the column
+        """
+        size = array.array(type_code).itemsize * length
+        column = view[offset:offset + size].cast(type_code)
+        return CatalogSnapshot.__align(offset + size), column
+
+    @staticmethod
+    def __align(offset):
+        return (offset + 7) // 8 * 8
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    def __contains__(self, game_id):
+        return self.__index(game_id) is not None
+
+    def __index(self, game_id):
+        i = bisect.bisect_left(self.game_ids, game_id)
+        return i if (i < len(self.game_ids)) and (self.game_ids[i] == game_id) else None
+
+    def load_games(self, game_id_list):
+        """
+        Create Game objects of some games
+
+        :param game_id_list: a list of BGG game ids
+        :return: a dict of Game objects (only games in snapshot)
+        """
+        games = {}
+        for game_id in game_id_list:
+            i = self.__index(game_id)
+            if i is not None:
+                games[game_id] = self.__game(i)
+        return games
+
+    def __game(self, i):
+        columns = self.__columns
+        g = Game(columns['game_id'][i])
+        g.updated = columns['updated'][i]
+        g.player_min, g.player_max, g.playing_time = [
+            value if value != self.NONE_VALUE else None
+            for value in (columns['player_min'][i], columns['player_max'][i], columns['playing_time'][i])]
+        g.average_weight, g.average_rating = [
+            value if not math.isnan(value) else None
+            for value in (columns['average_weight'][i], columns['average_rating'][i])]
+
+        flags = columns['flags'][i]
+        g.is_an_expansion = bool(flags & self.IS_AN_EXPANSION)
+        if flags & self.HAS_NAME:
+            g.name = bytes(self.__names[columns['name_offsets'][i]:columns['name_offsets'][i + 1]]).decode('utf-8')
+
+        start, end = columns['expansion_offsets'][i], columns['expansion_offsets'][i + 1]
+        if end > start:
+            g.expansion_of = set(self.__expansions[start:end].tolist())
+
+        start, end = columns['poll_offsets'][i], columns['poll_offsets'][i + 1]
+        if end > start:
+            values = self.__polls[start * 5:end * 5].tolist()
+            g.suggested_players = PlayerPoll([values[r:r + 5] for r in range(0, len(values), 5)])
+        return g
+
+    def close(self):
+        """
+        Close snapshot file (games already created can be used)
+        """
+        self.__columns = {}
+        self.__polls = self.__expansions = self.__names = self.game_ids = None
+        self.__mmap.close()
+
+    @classmethod
+    def write(cls, filename, games):
+        """
+        Write a snapshot (the file is replaced at the end, so processes using an older snapshot are not affected)
+
+        :param filename: a filename
+        :param games: an iterable of Game objects, sorted by id
+        :return: how many games are written
+        """
+        columns = dict([(name, array.array(type_code, [0] * extra)) for name, type_code, extra in cls.COLUMNS])
+        polls = array.array('q')
+        expansions = array.array('q')
+        names = bytearray()
+
+        for g in games:
+            columns['game_id'].append(g.game_id)
+            columns['updated'].append(g.updated if g.updated is not None else 0.0)
+            for name in ('player_min', 'player_max', 'playing_time'):
+                value = getattr(g, name)
+                columns[name].append(value if value is not None else cls.NONE_VALUE)
+            for name in ('average_weight', 'average_rating'):
+                value = getattr(g, name)
+                columns[name].append(value if value is not None else float('nan'))
+            columns['flags'].append((cls.IS_AN_EXPANSION if g.is_an_expansion else 0) |
+                                    (cls.HAS_NAME if g.name is not None else 0))
+
+            if g.name is not None:
+                names.extend(g.name.encode('utf-8'))
+            columns['name_offsets'].append(len(names))
+            expansions.extend(sorted(g.expansion_of or []))
+            columns['expansion_offsets'].append(len(expansions))
+            for poll_range in (g.suggested_players.ranges if g.suggested_players else []):
+                polls.extend(poll_range)
+            columns['poll_offsets'].append(len(polls) // 5)
+
+        temporary_filename = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary_filename, 'wb') as output:
+            output.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, int(sys.byteorder == 'little'),
+                                         len(columns['game_id']), len(polls) // 5, len(expansions), len(names)))
+            for data in [columns[name] for name, type_code, extra in cls.COLUMNS] + [polls, expansions, names]:
+                data = data.tobytes() if isinstance(data, array.array) else bytes(data)
+                output.write(data)
+                output.write(b'\0' * (cls.__align(output.tell()) - output.tell()))
+        os.replace(temporary_filename, filename)
+        return len(columns['game_id'])
+
+
+class ScoringEngine():
+    """
+    Used to rate many games at once: game and player data are packed into numpy arrays (one item for every game)
+    and every score is computed as a whole array operation. Results are the same of Master scalar rating.
+    Player stats are packed only for rated games, so a part of games can be rated (see rate index).
+    """
+
+    def __init__(self, collection, game_ids, game_group):
+        """
+        Pack game and player data
+
+        :param collection: a dict of Game objects
+        :param game_ids: which games must be rated
+        :param game_group: a list of Player objects
+        """
+        self.game_ids = list(game_ids)
+        self.position = dict([(game_id, i) for i, game_id in enumerate(self.game_ids)])
+        self.number_of_players = len(game_group)
+        games = [collection[game_id] for game_id in self.game_ids]
+        nan = float('nan')
+
+        self.playing_time = numpy.array(
+            [g.playing_time if g.playing_time is not None else nan for g in games], dtype=float)
+        self.average_weight = numpy.array(
+            [g.average_weight if g.average_weight is not None else nan for g in games], dtype=float)
+        self.average_rating = numpy.array([g.average_rating or 0.0 for g in games], dtype=float)
+
+        # Suggestion votes for the current number of players
+        suggestions = numpy.zeros((4, len(games)), dtype=float)
+        self.has_suggestion = numpy.zeros(len(games), dtype=bool)
+        for i, g in enumerate(games):
+            suggested_values = g.suggested_players.votes(self.number_of_players) if g.suggested_players else None
+            if suggested_values:
+                self.has_suggestion[i] = True
+                suggestions[:, i] = suggested_values + (sum(suggested_values), )
+        self.suggested_best, self.suggested_recommended, self.suggested_not_recommended, self.suggested_votes = \
+            suggestions
+
+        # Players are sorted by username, like in scalar rating (see Master.__players_score)
+        self.players = sorted([player for player in game_group if not player.is_guest], key=lambda p: p.username)
+        self.__components = {}
+        self.__suggestion_scores = None
+        self.__max_rating = None
+        # Players scores are computed once for every game, when needed
+        self.__players_values = numpy.zeros(len(games), dtype=float)
+        self.__players_known = numpy.zeros(len(games), dtype=bool)
+        # An engine can be shared by queries (see Session.score_cache)
+        self.__lock = threading.RLock()
+
+    def players_stats(self, index):
+        """
+        Pack player stats of some games (one row for every BGG user)
+
+        :param index: an array of game positions
+        :return: a tuple with has_stats, want_to_play, rating and play_count arrays
+        """
+        has_stats = numpy.zeros((len(self.players), len(index)), dtype=bool)
+        want_to_play = numpy.zeros((len(self.players), len(index)), dtype=bool)
+        rating = numpy.zeros((len(self.players), len(index)), dtype=float)
+        play_count = numpy.zeros((len(self.players), len(index)), dtype=float)
+        columns = dict([(self.game_ids[i], column) for column, i in enumerate(index.tolist())])
+        for p, player in enumerate(self.players):
+            # Only games of player collection are visited, then every array row is filled at once
+            owned = [(columns[game_id], stats) for game_id, stats in player.games_stats.items() if game_id in columns]
+            if not owned:
+                continue
+            count = len(owned)
+            stats_list = [stats for _, stats in owned]
+            columns_of_player = numpy.fromiter((column for column, _ in owned), dtype=numpy.intp, count=count)
+            has_stats[p, columns_of_player] = True
+            want_to_play[p, columns_of_player] = numpy.fromiter((stats.want_to_play for stats in stats_list),
+                                                                dtype=bool, count=count)
+            rating[p, columns_of_player] = numpy.fromiter((stats.rating or 0.0 for stats in stats_list), dtype=float,
+                                                          count=count)
+            play_count[p, columns_of_player] = numpy.fromiter((stats.play_count for stats in stats_list), dtype=float,
+                                                              count=count)
+        return has_stats, want_to_play, rating, play_count
+
+    def playing_time_scores(self, playing_time, weight):
+        """
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :return: a tuple with scores and score weights arrays
+        """
+        score_weight = SCORE_WEIGHTS['score_playing_time']
+        values = numpy.full(len(self.game_ids), 0.5 if weight else 0.0)
+        weights = numpy.full(len(self.game_ids), score_weight if weight else 0.0)
+
+        if playing_time is not None:
+            known = ~numpy.isnan(self.playing_time)
+            delta_time = numpy.abs(playing_time - self.playing_time[known])
+            max_delta = playing_time  # (-T < t < 2T )
+            raw_score = delta_time * ((3.0 / max_delta) if max_delta else 0.0) + 2.0
+            values[known] = numpy.where(delta_time >= max_delta, 0.0, 1.0 - (numpy.power(2.0, raw_score) - 4.0) / 28.0)
+            weights[known] = score_weight
+
+        return values, weights
+
+    def weight_scores(self, weight):
+        """
+        :param weight: desired game weight (or None)
+        :return: a tuple with scores and score weights arrays
+        """
+        score_weight = SCORE_WEIGHTS['score_weight']
+        values = numpy.full(len(self.game_ids), 0.5 if weight else 0.0)
+        weights = numpy.full(len(self.game_ids), score_weight if weight else 0.0)
+
+        if weight is not None:
+            known = ~numpy.isnan(self.average_weight)
+            delta_weight = numpy.abs(weight - self.average_weight[known])
+            max_delta = 2.5
+            raw_score = delta_weight * (2.0 / max_delta) + 2.0
+            values[known] = numpy.where(delta_weight >= max_delta, 0.0, 1.0 - (numpy.power(2.0, raw_score) - 4.0) / 16.0)
+            weights[known] = score_weight
+
+        return values, weights
+
+    def suggestion_scores(self):
+        """
+        :return: a tuple with scores and score weights arrays
+        """
+        with self.__lock:
+            if self.__suggestion_scores is None:
+                self.__suggestion_scores = self.__compute_suggestion_scores()
+            return self.__suggestion_scores
+
+    def __compute_suggestion_scores(self):
+        votes = numpy.where(self.has_suggestion, self.suggested_votes, 1.0)
+        score_suggestion = self.suggested_not_recommended * 0.5 / votes
+        score_suggestion += self.suggested_best * 1.0 / votes
+        score_suggestion += self.suggested_recommended * 0.5 / votes
+        score_suggestion -= self.suggested_not_recommended * 0.5 / votes
+
+        values = numpy.where(self.has_suggestion, numpy.maximum(0.0, score_suggestion), 0.6)
+        weights = numpy.full(len(self.game_ids), SCORE_WEIGHTS['suggested_values'])
+        return values, weights
+
+    def players_scores(self, index=None):
+        """
+        :param index: an array of game positions (None for every game)
+        :return: a tuple with scores and score weights arrays
+        """
+        if index is None:
+            index = numpy.arange(len(self.game_ids))
+        index = numpy.asarray(index, dtype=int)
+
+        with self.__lock:
+            missing = index[~self.__players_known[index]]
+            if len(missing) > 0:
+                self.__players_values[missing] = self.__compute_players_scores(missing)
+                self.__players_known[missing] = True
+            values = self.__players_values[index]
+
+        return values, numpy.full(len(index), SCORE_WEIGHTS['players_score'])
+
+    def __compute_players_scores(self, index):
+        has_stats, want_to_play, rating, play_count = self.players_stats(index)
+        average_rating = self.average_rating[index]
+
+        rated = average_rating != 0.0
+        # This rating is less important compared to game group ratings
+        players_score = numpy.where(rated, average_rating * 0.5, 0.0)
+        divide_by = numpy.where(rated, 0.5, 0.0)
+
+        has_rating = has_stats & (rating != 0.0)
+        want_to_play = has_stats & want_to_play
+        wanted_rated = want_to_play & has_rating
+        rated_only = has_rating & ~want_to_play
+        played = rated_only & (play_count != 0.0)
+
+        increments = numpy.where(wanted_rated, 0.8, numpy.where(want_to_play, 0.9,
+                                                                numpy.where(rated_only, rating * 0.8, 0.0)))
+        played_index = numpy.nonzero(played)
+        played_rating = rating[played_index]
+        increments[played_index] = numpy.exp(play_count[played_index] / numpy.power(2.0, played_rating * 10) * -1.0) * played_rating
+        rating_increments = numpy.where(wanted_rated, rating * 0.2, 0.0)
+
+        # Players are added one at time to keep the same float rounding of scalar rating
+        for p in range(0, has_stats.shape[0]):
+            players_score = players_score + increments[p]
+            players_score = players_score + rating_increments[p]
+        divide_by = divide_by + (want_to_play | has_rating).sum(axis=0)
+
+        return numpy.where(divide_by > 0.0, players_score / numpy.where(divide_by > 0.0, divide_by, 1.0), 0.5)
+
+    def components(self, playing_time, weight):
+        """
+        Scores which don't need player stats (cached for the last SCORE_CACHE_SIZE rating parameters, suggestion
+        scores don't depend on rating parameters and are computed once)
+
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :return: a list of tuples with scores and score weights arrays
+        """
+        key = (playing_time, weight)
+        with self.__lock:
+            if key not in self.__components:
+                if len(self.__components) >= SCORE_CACHE_SIZE:
+                    del self.__components[next(iter(self.__components))]
+                self.__components[key] = [
+                    self.playing_time_scores(playing_time, weight),
+                    self.weight_scores(weight),
+                    self.suggestion_scores(),
+                ]
+            return self.__components[key]
+
+    @staticmethod
+    def final_scores(scores):
+        """
+        :param scores: a list of tuples with scores and score weights arrays
+        :return: an array of final scores (not standardized)
+        """
+        # The .-=[ ** SCORE ** ]=-.
+        score_weights_sum = numpy.zeros(len(scores[0][0]))
+        final_score = numpy.zeros(len(scores[0][0]))
+        for values, weights in scores:
+            score_weights_sum += weights
+            final_score += values * weights
+        final_score /= score_weights_sum
+        return final_score
+
+    def rate(self, playing_time=None, weight=None, index=None):
+        """
+        Rate every game (or some games)
+
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :param index: an array of game positions (None for every game)
+        :return: a dict with game ids as keys and standardized scores as values
+        """
+        if index is None:
+            index = numpy.arange(len(self.game_ids))
+        index = numpy.asarray(index, dtype=int)
+
+        scores = [(values[index], weights[index]) for values, weights in self.components(playing_time, weight)]
+        scores.append(self.players_scores(index))
+        final_score = ScoringEngine.final_scores(scores)
+
+        return dict(zip([self.game_ids[i] for i in index.tolist()], ScoringEngine.standardize(final_score).tolist()))
+
+    def upper_bounds(self, playing_time=None, weight=None):
+        """
+        Find an upper bound of every game score without player stats: players score is an average of values
+        not greater than 1.0 (or than game and player ratings)
+
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :return: a dict with game ids as keys and standardized upper bounds as values
+        """
+        if self.__max_rating is None:
+            self.__max_rating = max([1.0] + [stats.rating or 0.0 for player in self.players
+                                             for stats in player.games_stats.values()])
+        players_bound = numpy.maximum(self.average_rating, self.__max_rating)
+
+        scores = list(self.components(playing_time, weight))
+        scores.append((players_bound, numpy.full(len(self.game_ids), SCORE_WEIGHTS['players_score'])))
+        final_score = ScoringEngine.final_scores(scores) + SCORE_BOUND_SLACK
+
+        return dict(zip(self.game_ids, ScoringEngine.standardize(final_score).tolist()))
+
+    @staticmethod
+    def standardize(values):
+        """
+        Array version of standardize function (same rounding of python round)
+
+        :param values: an array of floats
+        :return: an array of standardized floats
+        """
+        rounded = numpy.round(values, 4)
+
+        # Values near a rounding tie can be rounded differently, use python round for them
+        fraction = values * 10000.0 - numpy.floor(values * 10000.0)
+        ties = numpy.flatnonzero(numpy.abs(fraction - 0.5) < 1e-6)
+        for i in ties.tolist():
+            rounded[i] = round(float(values[i]), 4)
+
+        return numpy.clip(rounded, 0.0, 1.0)
+
+
+class ExpansionGraph():
+    """
+    Used to link expansions to their base games (an expansion can be an expansion of another expansion).
+
+    A chain of games from a base game to an expansion is playable if the number of players is between the highest
+    minimum and the highest maximum number of players of the games in the chain. Instead of listing every chain,
+    every game keeps the set of chain states that can reach it (has a minimum number of players, has a maximum
+    number of players greater or equal to the number of players), so a single pass over the graph (in topological
+    order) is enough to find the playable expansions of every base game.
+    """
+    HAS_MIN = 2
+    HAS_MAX = 1
+    PLAYABLE = HAS_MIN | HAS_MAX
+
+    # States are stored as bit masks: OR_STATES[states][flags] are the states after adding a game with given flags
+    OR_STATES = [[sum([1 << state for state in range(0, 4)
+                       if any([(states & (1 << s)) and ((s | flags) == state) for s in range(0, 4)])])
+                  for flags in range(0, 4)] for states in range(0, 16)]
+    # PLAYABLE_STATES[prefix_states][suffix_states] is True if a prefix and a suffix make a playable chain
+    PLAYABLE_STATES = [[any([(p | s) == 3 for p in range(0, 4) for s in range(0, 4)
+                             if (prefix_states & (1 << p)) and (suffix_states & (1 << s))])
+                        for suffix_states in range(0, 16)] for prefix_states in range(0, 16)]
+
+    def __init__(self, collection, possible_collection, available_collection):
+        """
+        Build the graph
+
+        :param collection: a dict of Game objects
+        :param possible_collection: games playable by the game group (expansions are nodes of the graph)
+        :param available_collection: games owned by the collection group (base games must be owned)
+        """
+        self.collection = collection
+        self.nodes = {}
+        self.successors = {}
+
+        for game_id in possible_collection:
+            game = collection[game_id]
+            if game.expansion_of:
+                self.__add_node(game_id)
+                for base_id in game.expansion_of:
+                    if base_id in available_collection:
+                        self.__add_node(base_id)
+                        if game_id not in self.successors[base_id]:
+                            self.successors[base_id].append(game_id)
+
+    def __add_node(self, game_id):
+        if game_id not in self.nodes:
+            self.nodes[game_id] = not self.collection[game_id].is_an_expansion
+            self.successors[game_id] = []
+
+    def __topological_order(self):
+        """
+        :return: a list of nodes in topological order (games in a cycle are skipped)
+        """
+        in_degree = dict([(node, 0) for node in self.nodes])
+        for node in self.nodes:
+            for successor in self.successors[node]:
+                in_degree[successor] += 1
+
+        order = [node for node in self.nodes if in_degree[node] == 0]
+        for node in order:
+            for successor in self.successors[node]:
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    order.append(successor)
+
+        return order
+
+    @profiled('expansion graph')
+    def playable_expansions(self, number_of_players):
+        """
+        Find expansions playable by a game group
+
+        :param number_of_players: how many players in game group
+        :return: a dict with base game ids as keys and a list of games on playable chains (base game included)
+        """
+        # Games with a minimum number of players greater than number of players cannot be in a playable chain
+        flags = {}
+        for node in self.nodes:
+            game = self.collection[node]
+            if (game.player_min is not None) and (game.player_min > number_of_players):
+                continue
+            flags[node] = self.HAS_MIN if game.player_min is not None else 0
+            if (game.player_max is not None) and (game.player_max >= number_of_players):
+                flags[node] |= self.HAS_MAX
+
+        order = [node for node in self.__topological_order() if node in flags]
+        if METRICS.enabled:
+            METRICS.count('expansion_graph_nodes', len(order))
+            METRICS.count('expansion_graph_edges', sum([len(self.successors[node]) for node in order]))
+
+        # Chains from a game to an expansion
+        suffix = {}
+        for node in reversed(order):
+            states = 0 if self.nodes[node] else (1 << flags[node])
+            for successor in self.successors[node]:
+                if successor in flags:
+                    states |= self.OR_STATES[suffix[successor]][flags[node]]
+            suffix[node] = states
+
+        # Chains from every base game to a game
+        prefix = {}
+        for node in order:
+            if self.nodes[node]:
+                prefix[node] = {node: 1 << flags[node]}
+            for successor in self.successors[node]:
+                if successor in flags:
+                    successor_prefix = prefix.setdefault(successor, {})
+                    for base_id, states in prefix.get(node, {}).items():
+                        successor_prefix[base_id] = successor_prefix.get(base_id, 0) | \
+                            self.OR_STATES[states][flags[successor]]
+
+        base_to_exp = {}
+        for node in self.nodes:
+            for base_id, states in prefix.get(node, {}).items():
+                if (base_id != node) and self.PLAYABLE_STATES[states][suffix[node]]:
+                    base_to_exp.setdefault(base_id, [base_id]).append(node)
+
+        return base_to_exp
+
+
+class PlayersScoreMemo():
+    """
+    Players scores (a score for every game) of recent game groups, shared by queries.
+
+    A group is identified by its BGG users (sorted usernames, guests don't change players score) and by the version
+    (update time) of their stats, so scores of a refreshed player are not used anymore. Least recently used groups
+    are dropped when the memo has more than max_size scores. A memo can be saved to a file and loaded by next runs.
+    """
+    def __init__(self, max_size=PLAYERS_SCORE_MEMO_SIZE):
+        """
+        :param max_size: max number of cached scores (of every group)
+        """
+        self.max_size = max_size
+        self.__groups = {}
+        self.__user_groups = {}
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def group_key(players):
+        """
+        :param players: a list of Player objects
+        :return: the key of players group
+        """
+        return tuple(sorted([(player.username, player.updated) for player in players if not player.is_guest]))
+
+    def scores(self, players):
+        """
+        Get cached scores of a group (the group becomes the most recently used)
+
+        :param players: a list of Player objects
+        :return: a dict with game ids as keys, new scores must be added with set_score
+        """
+        key = PlayersScoreMemo.group_key(players)
+        with self.__lock:
+            scores = self.__groups.pop(key, None)
+            if scores is None:
+                scores = {}
+                # Scores of an older version of these players are not used anymore
+                for username, updated in key:
+                    for stale_key in [group for group in self.__user_groups.get(username, ())
+                                      if dict(group)[username] != updated]:
+                        self.__drop(stale_key)
+                self.__add(key, scores)
+            else:
+                self.__groups[key] = scores
+            return scores
+
+    def set_score(self, players, game_id, score):
+        """
+        Add a score to the cached scores of a group (nothing is cached if the group was dropped meanwhile)
+
+        :param players: a list of Player objects
+        :param game_id: a BGG game id
+        :param score: the score of the game
+        """
+        key = PlayersScoreMemo.group_key(players)
+        with self.__lock:
+            scores = self.__groups.get(key, None)
+            if scores is None:
+                return
+            if game_id not in scores:
+                self.__size += 1
+            scores[game_id] = score
+            self.__drop_oldest()
+
+    def __add(self, key, scores):
+        """
+        Add a group as the most recently used (caller must hold the lock)
+        """
+        self.__groups[key] = scores
+        self.__size += len(scores)
+        for username, _ in key:
+            self.__user_groups.setdefault(username, set()).add(key)
+
+    def __drop(self, key):
+        """
+        Drop a group (caller must hold the lock)
+        """
+        self.__size -= len(self.__groups.pop(key))
+        for username, _ in key:
+            groups = self.__user_groups[username]
+            groups.discard(key)
+            if not groups:
+                del self.__user_groups[username]
+
+    def __drop_oldest(self):
+        """
+        Drop least recently used groups until the memo has at most max_size scores (caller must hold the lock)
+        """
+        while (self.__size > self.max_size) and (len(self.__groups) > 1):
+            self.__drop(next(iter(self.__groups)))
+
+    def __len__(self):
+        with self.__lock:
+            return self.__size
+
+    def load(self, filename):
+        """
+        Load scores saved by a previous run (scores saved by another memo version are skipped)
+
+        :param filename: a filename
+        :return: True if scores are loaded, False otherwise
+        """
+        saved = load_object(filename)
+        if (not isinstance(saved, dict)) or (saved.get('version', None) != PLAYERS_SCORE_MEMO_VERSION) or \
+                (saved.get('weight', None) != SCORE_WEIGHTS['players_score']):
+            return False
+
+        with self.__lock:
+            for key, scores in saved['groups']:
+                if key in self.__groups:
+                    self.__drop(key)
+                self.__add(key, scores)
+            self.__drop_oldest()
+        log().debug('Loaded %d players scores' % len(self))
+        return True
+
+    def save(self, filename):
+        """
+        Save scores to file
+
+        :param filename: a filename
+        :return: True if no error, False otherwise
+        """
+        with self.__lock:
+            groups = [(key, dict(scores)) for key, scores in self.__groups.items()]
+        return save_object({'version': PLAYERS_SCORE_MEMO_VERSION, 'weight': SCORE_WEIGHTS['players_score'],
+                            'groups': groups}, filename)
+
+
+class SuggestionError(Exception):
+    """
+    Raised when Master cannot suggest any game
+    """
+    def __init__(self, message, exit_code=None):
+        """
+        :param message: error description
+        :param exit_code: script exit code
+        """
+        Exception.__init__(self, message)
+        self.exit_code = exit_code
+
+
+class Session():
+    """
+    Players and games loaded by Master, a session can be shared by many Master (one for every query)
+    to load data only once.
+
+    Games must be added with add_games, so indexes used to select playable games are kept up to date: games
+    playable by a number of players (built on first use for every number of players) and expansions of every
+    base game. Every change increases the session version.
+
+    Score components which don't depend on rating parameters are kept too (see score_cache and players_scores),
+    so a query which changes only playing time or weight computes again only those scores.
+
+    With a catalog snapshot (see CatalogSnapshot) games are loaded from the snapshot when needed, before the cache.
+    """
+    def __init__(self, catalog=None):
+        """
+        :param catalog: a CatalogSnapshot object (or None)
+        """
+        self.catalog = catalog
+        self.players = {}
+        self.games = {}
+        self.version = 0
+        self.checked = time.time()
+        self.__owned_games = {}
+        self.__playable_games = {}
+        self.__expansions = {}
+        self.__expansion_ids = set([])
+        self.__score_caches = {}
+        self.players_scores = PlayersScoreMemo()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def is_playable(game, number_of_players):
+        """
+        Check if a game can be played by a number of players (games without player range are always playable)
+
+        :param game: a Game object
+        :param number_of_players: how many players
+        :return: True if game is playable, False otherwise
+        """
+        return (game.player_min is None) or (game.player_max is None) or \
+            (game.player_min <= number_of_players <= game.player_max)
+
+    def add_games(self, games):
+        """
+        Add (or replace) games
+
+        :param games: a dict of Game objects
+        """
+        with self.__lock:
+            self.__add_games(games)
+
+    def __add_games(self, games):
+        for game_id, g in games.items():
+            old = self.games.get(game_id, None)
+            if old is not None:
+                for playable_games in self.__playable_games.values():
+                    playable_games.discard(game_id)
+                if old.is_an_expansion:
+                    self.__expansion_ids.discard(game_id)
+                    for base_id in (old.expansion_of or []):
+                        self.__expansions[base_id].discard(game_id)
+
+            self.games[game_id] = g
+            for number_of_players, playable_games in self.__playable_games.items():
+                if Session.is_playable(g, number_of_players):
+                    playable_games.add(game_id)
+            if g.is_an_expansion:
+                self.__expansion_ids.add(game_id)
+                for base_id in (g.expansion_of or []):
+                    self.__expansions.setdefault(base_id, set([])).add(game_id)
+
+        self.version += 1
+
+    def owned_games(self, player):
+        """
+        Get games owned by a player (computed once for every loaded player)
+
+        :param player: a Player object
+        :return: a frozenset of game ids
+        """
+        owned = self.__owned_games.get(player.username, None)
+        if (owned is None) or (owned[0] is not player):
+            owned = (player, frozenset([game_id for game_id, stats in player.games_stats.items() if stats.owned]))
+            self.__owned_games[player.username] = owned
+        return owned[1]
+
+    def score_cache(self, name, key, create=dict):
+        """
+        Get a cache shared by queries, only the last SCORE_CACHE_SIZE keys of every cache name are kept
+
+        :param name: cache name
+        :param key: what cached values depend on (a hashable object)
+        :param create: a function which creates a new cache (a dict by default)
+        :return: the cache
+        """
+        with self.__lock:
+            caches = self.__score_caches.setdefault(name, {})
+            if key in caches:
+                return caches[key]
+
+        # A cache can be slow to create (a ScoringEngine), other queries must not wait
+        cache = create()
+        with self.__lock:
+            if key not in caches:
+                if len(caches) >= SCORE_CACHE_SIZE:
+                    del caches[next(iter(caches))]
+                caches[key] = cache
+            return caches[key]
+
+    def snapshot(self, game_id_list):
+        """
+        Get loaded games of a list (later changes of session games do not change the snapshot)
+
+        :param game_id_list: a list of game ids
+        :return: a dict of Game objects and session version
+        """
+        with self.__lock:
+            games = self.games
+            return dict([(game_id, games[game_id]) for game_id in game_id_list if game_id in games]), self.version
+
+    def playable_games(self, available_games, number_of_players, version):
+        """
+        Select games playable by a number of players: number of players must be in game player range and expansions
+        need an available base game
+
+        :param available_games: a set of available game ids
+        :param number_of_players: how many players
+        :param version: session version of available games snapshot
+        :return: a set of game ids, None if session changed after the snapshot
+        """
+        with self.__lock:
+            if version != self.version:
+                return None
+
+            if number_of_players not in self.__playable_games:
+                self.__playable_games[number_of_players] = set([game_id for game_id, g in self.games.items()
+                                                                if Session.is_playable(g, number_of_players)])
+
+            playable_games = available_games & self.__playable_games[number_of_players]
+            linked_expansions = set([])
+            for base_id in self.__expansions.keys() & available_games:
+                linked_expansions.update(self.__expansions[base_id])
+            playable_games.difference_update((playable_games & self.__expansion_ids) - linked_expansions)
+            return playable_games
+
+    def load_cache(self):
+        """
+        Load every cached player and game (with a catalog snapshot, games are loaded when needed)
+        """
+        with self.__lock:
+            self.checked = time.time()
+            store = cache_store()
+            for username in store.updated_players(0):
+                p = store.load_player(username)
+                if p is not None:
+                    self.players[username] = p
+            if self.catalog is None:
+                self.__add_games(store.load_games(store.updated_games(0).keys()))
+            log().info('Loaded %d players and %d games from cache' % (len(self.players), len(self.games)))
+
+    def load_catalog_games(self, game_id_list):
+        """
+        Add games from catalog snapshot
+
+        :param game_id_list: a list of game ids
+        :return: a dict of loaded Game objects
+        """
+        if self.catalog is None:
+            return {}
+
+        games = self.catalog.load_games(game_id_list)
+        if games:
+            self.add_games(games)
+        return games
+
+    def reload_changed(self, interval=SESSION_RELOAD_INTERVAL):
+        """
+        Reload players and games changed in cache (by other processes or background refresh)
+
+        :param interval: minimum seconds between two checks
+        :return: how many players and games are reloaded
+        """
+        with self.__lock:
+            now = time.time()
+            if now - self.checked < interval:
+                return 0
+
+            # A write can be committed after its update time, so check again a little of the past
+            since = self.checked - SESSION_RELOAD_MARGIN
+            self.checked = now
+
+            store = cache_store()
+            reloaded = 0
+            for username, updated in store.updated_players(since).items():
+                if (username in self.players) and (self.players[username].updated != updated):
+                    p = store.load_player(username)
+                    if p is not None:
+                        self.players[username] = p
+                        reloaded += 1
+
+            changed_games = [game_id for game_id, updated in store.updated_games(since).items()
+                             if (game_id in self.games) and (self.games[game_id].updated != updated)]
+            if changed_games:
+                games = store.load_games(changed_games)
+                self.__add_games(games)
+                reloaded += len(games)
+
+            if reloaded:
+                log().info('Reloaded %d changed players and games from cache' % reloaded)
+            return reloaded
+
+
+class Master():
+    """
+    The Master class :P (do all the works)
+    """
+    def __init__(self, clear_cache=False, player_ttl=PLAYER_CACHE_TTL, game_ttl=GAME_CACHE_TTL,
+                 background_refresh=False, session=None):
+        self.__clear_cache = clear_cache
+        self.__player_ttl = player_ttl
+        self.__game_ttl = game_ttl
+        self.__background_refresh = background_refresh
+        self.__session = session if session is not None else Session()
+        # Players that cannot be refreshed by this query are not downloaded again
+        self.__failed_refreshes = set([])
+        self.__game_group = []
+        self.__collection_group = []
+        self.__collection = {}
+        self.__session_version = None
+        self.__available_collection = set([])
+        self.__possible_collection = set([])
+        self.__rating_order = []
+        self.__scoring_engine = None
+        self.__group_players = []
+        self.__suggestion_scores = {}
+        self.__players_scores = {}
+        self.__evaluations = {}
+        self.__detailed_evaluations = {}
+        self.__rating_parameters = (None, None)
+
+    def __create_players_group(self, username_list):
+        return Player.create_players_group(username_list, use_cache=(not self.__clear_cache),
+                                           max_age=self.__player_ttl, background_refresh=self.__background_refresh,
+                                           loaded_players=self.__session.players,
+                                           failed_refreshes=self.__failed_refreshes)
+
+    @profiled('add_known_players')
+    def add_known_players(self, username_list):
+        """
+        This method adds BBG users to game group
+
+        :param username_list: a list of BGG usernames
+        """
+        log().info('Adding BGG players ..')
+        self.__game_group = self.__create_players_group(username_list)
+        if self.__game_group is None:
+            log().error('Cannot load players data, quit')
+            raise SuggestionError('Cannot load players data', 1)
+
+    @profiled('add_guests')
+    def add_guests(self, number_of_guests):
+        """
+        This method adds guests (not BGG users) to game group
+
+        :param number_of_guests: how many guests in game group
+        """
+        log().info('Adding guests ..')
+        for i in range(0, number_of_guests):
+            self.__game_group.append(Player('GUEST_%d' % i, is_guest=True))
+
+    @profiled('use_games_owned_by_these_players')
+    def use_games_owned_by_these_players(self, username_list):
+        """
+        This method gather all games owned by a list of BGG users
+
+        :param username_list: a list of BGG usernames
+        """
+        log().info('Adding player game collections ..')
+        self.__collection_group = self.__create_players_group(username_list)
+        if self.__collection_group is None:
+            log().error('Cannot load players data, quit')
+            raise SuggestionError('Cannot load players data', 1)
+
+        # Select only owned games
+        collection_group_games = set([]).union(*[self.__session.owned_games(player)
+                                                 for player in self.__collection_group])
+
+        # Which games must be downloaded (games already loaded in session are used if not stale)
+        games = self.__session.games
+        missing_games = set([game_id for game_id in collection_group_games
+                             if (game_id not in games) or games[game_id].is_stale(self.__game_ttl)])
+        METRICS.count('games_session_hits', len(collection_group_games) - len(missing_games))
+
+        if missing_games and (self.__session.catalog is not None) and not self.__clear_cache:
+            catalog_games = self.__session.load_catalog_games(missing_games)
+            METRICS.count('games_catalog_hits', len(catalog_games))
+            # Stale games are loaded again from cache (or downloaded)
+            missing_games.difference_update([game_id for game_id, g in catalog_games.items()
+                                             if not g.is_stale(self.__game_ttl)])
+
+        if missing_games and not self.__clear_cache:
+            log().info('Loading games data from cache ..')
+            cached_collection = Game.load_games_collection_from_cache(missing_games)
+            if cached_collection:
+                self.__session.add_games(cached_collection)
+                # Remove cached games from missing games
+                missing_games.difference_update(cached_collection.keys())
+
+                # Download again stale games (cached data is used if download fails)
+                stale_games = set([game_id for game_id, g in cached_collection.items() if g.is_stale(self.__game_ttl)])
+                METRICS.count('games_cache_hits', len(cached_collection) - len(stale_games))
+                METRICS.count('games_cache_stale', len(stale_games))
+                if stale_games:
+                    log().info('Cached data for %d games is stale' % len(stale_games))
+                    if self.__background_refresh:
+                        refresh_in_background('game', sorted(stale_games), Game.refresh_games_cache,
+                                              Game.cached_since)
+                    else:
+                        missing_games.update(stale_games)
+
+        if missing_games:
+            log().info('Downloading games data from BGG ..')
+            METRICS.count('games_cache_misses', len(missing_games))
+            fetch_once('game', sorted(missing_games),
+                       lambda game_ids: Game.download_games_data(game_ids, on_batch=self.__add_downloaded_games),
+                       self.__load_fetched_games)
+
+        # Use a snapshot of session games (session can be updated by other queries)
+        self.__collection, self.__session_version = self.__session.snapshot(collection_group_games)
+
+        # Check if we have at least one game
+        if not self.__collection:
+            log().error('Cannot find games in given collections, exit')
+            raise SuggestionError('Cannot find games in given collections')
+
+    def __load_fetched_games(self, game_id_list, since):
+        """
+        Load from cache games downloaded by other processes and add them to session
+
+        :param game_id_list: a list of BGG game ids
+        :param since: only games updated after this time are loaded
+        :return: a set of loaded game ids
+        """
+        cached_collection = Game.load_games_collection_from_cache(game_id_list) or {}
+        games = dict([(game_id, g) for game_id, g in cached_collection.items() if g.updated >= since])
+        if games:
+            self.__session.add_games(games)
+        return set(games)
+
+    def __add_downloaded_games(self, games):
+        """
+        Add downloaded games to session and save them to cache
+
+        :param games: a dict of Game objects
+        """
+        self.__session.add_games(games)
+        METRICS.count('games_downloaded', len(games))
+        log().debug('Saving %d games to cache ..' % len(games))
+        Game.save_games_collection_to_cache(games)
+
+    @profiled('rate_our_games')
+    def rate_our_games(self, playing_time=None, weight=None):
+        """
+        This method selects every playable games, games are rated when needed by get_decision
+
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        """
+        # Collection has only games owned by collection group
+        self.__available_collection = set(self.__collection)
+
+        if not self.__available_collection:
+            log().error('No available games, check usernames and/or collections for owned games')
+            raise SuggestionError('No available games, check usernames and/or collections for owned games')
+
+        # Select only playable games (with session indexes, unless session games changed after the snapshot)
+        number_of_players = len(self.__game_group)
+        self.__possible_collection = self.__session.playable_games(self.__available_collection, number_of_players,
+                                                                   self.__session_version)
+        if self.__possible_collection is None:
+            self.__possible_collection = set([])
+            for game_id in self.__available_collection:
+                g = self.__collection[game_id]
+
+                # Check number of players
+                if not Session.is_playable(g, number_of_players):
+                    continue
+
+                # Check if we own base game of expansions
+                if g.is_an_expansion:
+                    if all([(base_id not in self.__available_collection) for base_id in (g.expansion_of or [])]):
+                        continue
+
+                self.__possible_collection.add(game_id)
+
+        # If no game is possible
+        if not self.__possible_collection:
+            log().error('No possible games for this game group, sorry')
+            raise SuggestionError('No possible games for this game group')
+
+        # Prepare rating calculation
+        self.__rating_parameters = (playing_time, weight)
+        # Games with the same score are listed by id (set order depends on how session indexes were updated)
+        self.__rating_order = sorted(self.__possible_collection)
+
+        # Score components which don't depend on rating parameters are shared with other queries of the same group
+        group = PlayersScoreMemo.group_key(self.__game_group)
+        self.__group_players = sorted([player for player in self.__game_group if not player.is_guest],
+                                      key=lambda player: player.username)
+        self.__suggestion_scores = self.__session.score_cache('suggestion scores', number_of_players)
+        self.__players_scores = self.__session.players_scores.scores(self.__game_group)
+
+        # Scores are the same, but small collections are rated faster without importing numpy
+        if (len(self.__rating_order) >= SCORING_ENGINE_MIN_GAMES) and numpy.is_installed():
+            self.__scoring_engine = self.__session.score_cache(
+                'scoring engines', (self.__session_version, group, number_of_players, tuple(self.__rating_order)),
+                lambda: ScoringEngine(self.__collection, self.__rating_order, self.__game_group))
+
+    @profiled('rate games')
+    def __rate_games(self, game_id_list):
+        """
+        Rate some possible games (games already rated are skipped)
+
+        :param game_id_list: a list of possible game ids
+        """
+        game_id_list = [game_id for game_id in game_id_list if game_id not in self.__evaluations]
+        if not game_id_list:
+            return
+
+        METRICS.count('games_rated', len(game_id_list))
+        if self.__scoring_engine is not None:
+            position = self.__scoring_engine.position
+            self.__evaluations.update(self.__scoring_engine.rate(*self.__rating_parameters,
+                                                                 index=[position[game_id] for game_id in game_id_list]))
+        else:
+            for game_id in game_id_list:
+                self.__evaluations[game_id], self.__detailed_evaluations[game_id] = \
+                    self.__rate_game(game_id, *self.__rating_parameters)
+
+    def __upper_bounds(self):
+        """
+        Find an upper bound of every possible game score (player stats are not used)
+
+        :return: a dict with game ids as keys and score upper bounds as values
+        """
+        if self.__scoring_engine is not None:
+            return self.__scoring_engine.upper_bounds(*self.__rating_parameters)
+
+        max_rating = max([1.0] + [stats.rating or 0.0 for player in self.__game_group if not player.is_guest
+                                  for stats in player.games_stats.values()])
+        return dict([(game_id, self.__rate_game(game_id, *self.__rating_parameters,
+                                                players_bound=max(max_rating, self.__collection[game_id].average_rating or 0.0))[0])
+                     for game_id in self.__rating_order])
+
+    def __rate_game(self, game_id, playing_time, weight, players_bound=None):
+        """
+        Rate a single game (scalar version of ScoringEngine)
+
+        :param game_id: a possible game id
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :param players_bound: if given players score is not calculated and this value is used instead,
+        so returned score is an upper bound of game score
+        :return: a tuple with game score and its detailed evaluation
+        """
+        g = self.__collection[game_id]
+        scores = {}
+        detailed_evaluation = {}
+
+        # GENERAL
+        for key, (score, detail) in (('score_playing_time', Master.__playing_time_score(g, playing_time, weight)),
+                                     ('score_weight', Master.__weight_score(g, weight)),
+                                     ('suggested_values', self.__cached_score(self.__suggestion_scores, g,
+                                                                              self.__suggestion_score, g))):
+            scores[key] = score
+            if detail is not None:
+                detailed_evaluation[key] = detail
+
+        # PERSONAL
+        if players_bound is not None:
+            scores['players_score'] = [players_bound, SCORE_WEIGHTS['players_score']]
+            final_score = sum([score[0] * score[1] for score in scores.values()]) / sum([score[1] for score in scores.values()])
+            return standardize(final_score + SCORE_BOUND_SLACK), detailed_evaluation
+
+        scores['players_score'], detail = self.__cached_score(self.__players_scores, g, self.__players_score,
+                                                              g.average_rating, self.__store_players_score)
+        detailed_evaluation.update(detail)
+
+        # The .-=[ ** SCORE ** ]=-.
+        score_weights_sum = sum([score[1] for score in scores.values()])
+        if score_weights_sum > 0.0:
+            final_score = sum([score[0] * score[1] for score in scores.values()]) / score_weights_sum
+            return standardize(final_score), detailed_evaluation
+        else:
+            return 0.0, detailed_evaluation
+
+    def __store_players_score(self, game_id, score):
+        """
+        Add a players score to the scores shared by queries of the same group
+
+        :param game_id: a BGG game id
+        :param score: a cached score (see __cached_score)
+        """
+        self.__session.players_scores.set_score(self.__game_group, game_id, score)
+
+    @staticmethod
+    def __cached_score(cache, g, rate, game_data, store=None):
+        """
+        Get a score component from a cache (a cached score is used only if game data is the same)
+
+        :param cache: a dict with game ids as keys
+        :param g: a Game object
+        :param rate: a function which computes the score component of a game
+        :param game_data: game data used by rate function (a Game object if it uses many attributes)
+        :param store: a function which adds a computed score to cache (called with game id and score, None to set it
+                      in cache dict)
+        :return: a tuple with score (value and weight) and its detailed evaluation
+        """
+        cached = cache.get(g.game_id, None)
+        if (cached is None) or (cached[0] != game_data):
+            cached = (game_data, ) + rate(g)
+            if store is None:
+                cache[g.game_id] = cached
+            else:
+                store(g.game_id, cached)
+        return cached[1], cached[2]
+
+    @staticmethod
+    def __playing_time_score(g, playing_time, weight):
+        """
+        :param g: a Game object
+        :param playing_time: desired playing time (or None)
+        :param weight: desired game weight (or None)
+        :return: a tuple with score (value and weight) and its detailed evaluation (or None)
+        """
+        score = [0.0, 0.0]
+        detail = None
+        if weight:
+            score = [0.5, SCORE_WEIGHTS['score_playing_time']]
+            detail = ['Default', SCORE_WEIGHTS['score_playing_time']]
+
+        if (g.playing_time is not None) & (playing_time is not None):
+            delta_time = abs(playing_time - g.playing_time)
+            max_delta = playing_time  # (-T < t < 2T )
+            if delta_time >= max_delta:
+                score = [0.0, SCORE_WEIGHTS['score_playing_time']]
+            else:
+                raw_score = delta_time * (3.0 / max_delta) + 2.0
+                score = [1.0 - (pow(2, raw_score) - 4.0) / 28.0, SCORE_WEIGHTS['score_playing_time']]
+            detail = score
+
+        return score, detail
+
+    @staticmethod
+    def __weight_score(g, weight):
+        """
+        :param g: a Game object
+        :param weight: desired game weight (or None)
+        :return: a tuple with score (value and weight) and its detailed evaluation (or None)
+        """
+        score = [0.0, 0.0]
+        detail = None
+        if weight:
+            score = [0.5, SCORE_WEIGHTS['score_weight']]
+            detail = ['Default', SCORE_WEIGHTS['score_weight']]
+
+        if (g.average_weight is not None) & (weight is not None):
+            delta_weight = abs(weight - g.average_weight)
+            max_delta = 2.5
+            if delta_weight >= max_delta:
+                score = [0.0, SCORE_WEIGHTS['score_weight']]
+            else:
+                raw_score = delta_weight * (2.0 / max_delta) + 2.0
+                score = [1.0 - (pow(2, raw_score) - 4.0) / 16.0, SCORE_WEIGHTS['score_weight']]
+            detail = score
+
+        return score, detail
+
+    def __suggestion_score(self, g):
+        """
+        BGG user suggested number of player (depends only on number of players)
+
+        :param g: a Game object
+        :return: a tuple with score (value and weight) and its detailed evaluation
+        """
+        score = [0.6, SCORE_WEIGHTS['suggested_values']]
+        detail = ['Default', SCORE_WEIGHTS['suggested_values']]
+        if g.suggested_players:
+            suggested_values = g.suggested_players.votes(len(self.__game_group))
+            if suggested_values:
+                best, recommended, not_recommended = suggested_values
+                suggested_max_score = sum(suggested_values)
+                score_suggestion = not_recommended * 0.5 / suggested_max_score
+                score_suggestion += best * 1.0 / suggested_max_score
+                score_suggestion += recommended * 0.5 / suggested_max_score
+                score_suggestion -= not_recommended * 0.5 / suggested_max_score
+                score = [max(0.0, score_suggestion), SCORE_WEIGHTS['suggested_values']]
+                detail = score
+
+        return score, detail
+
+    def __players_score(self, g):
+        """
+        Players score, use average rating + play count + want + user rating (depends only on BGG users of game group
+        and game average rating). Players are added by username, so the same group has always the same score.
+
+        :param g: a Game object
+        :return: a tuple with score (value and weight) and its detailed evaluation (a dict)
+        """
+        score = [0.5, SCORE_WEIGHTS['players_score']]
+        detailed_evaluation = {}
+        players_score = 0.0
+        divide_by = 0.0
+
+        if g.average_rating:
+            # This rating is less important compared to game group ratings
+            players_score = g.average_rating * 0.5
+            divide_by = 0.5
+
+        for player in self.__group_players:
+            if g.game_id not in player.games_stats:
+                continue
+
+            stats = player.games_stats[g.game_id]
+
+            partial = players_score  #Hack
+            if stats.want_to_play:
+                if stats.rating:
+                    players_score += 0.8
+                    players_score += stats.rating * 0.2
+                else:
+                    players_score += 0.9
+            else:
+                if stats.rating:
+                    if stats.play_count != 0:
+                        players_score += math.exp(stats.play_count / pow(2.0, stats.rating * 10) * -1.0) * stats.rating
+                    else:
+                        players_score += stats.rating * 0.8
+                else:
+                    continue
+
+            divide_by += 1.0
+
+            if 'players_score' not in detailed_evaluation:
+                detailed_evaluation['players_score'] = {}
+            detailed_evaluation['players_score'][player.username] = standardize(players_score - partial)
+
+        if divide_by > 0.0:
+            score = [players_score / divide_by, SCORE_WEIGHTS['players_score']]
+            detailed_evaluation['all_players_score'] = score
+
+        return score, detailed_evaluation
+
+    def __get_detailed_evaluation(self, game_id):
+        """
+        Get the detailed evaluation of a rated game (computed on demand)
+
+        :param game_id: a rated game id
+        :return: a dict with every score component
+        """
+        if game_id not in self.__detailed_evaluations:
+            self.__detailed_evaluations[game_id] = self.__rate_game(game_id, *self.__rating_parameters)[1]
+        return self.__detailed_evaluations[game_id]
+
+    def __suggestion(self, game_id, score=None, detailed=True):
+        """
+        Describe a rated game
+
+        :param game_id: a game id
+        :param score: ranking score (if None game score is used)
+        :param detailed: add detailed evaluation
+        :return: a dict with game id, name, score and detailed evaluation (None if game is not rated or not detailed)
+        """
+        game_score = self.__evaluations.get(game_id, None)
+        return {
+            'game_id': game_id,
+            'name': self.__collection[game_id].name,
+            'score': score if score is not None else game_score,
+            'game_score': game_score,
+            'evaluation': self.__get_detailed_evaluation(game_id) if detailed and (game_score is not None) else None
+        }
+
+    def __ranking_scores(self, ranked_games, groups, scores):
+        """
+        :param ranked_games: a list of game ids
+        :param groups: rated games and default score (or None) of game ids ranked as a group (see get_decision)
+        :param scores: a dict of game scores (or score upper bounds)
+        :return: a list with ranking score of every ranked game
+        """
+        ranking_scores = []
+        for game_id in ranked_games:
+            if game_id in groups:
+                game_ids, default = groups[game_id]
+                ranking_scores.append(max(([default] if default is not None else []) + [scores[e] for e in game_ids]))
+            else:
+                ranking_scores.append(scores[game_id])
+        return ranking_scores
+
+    def __top_ranking(self, ranked_games, groups, limit):
+        """
+        Find best ranked games without rating every game: games are rated by descending score upper bound
+        and rating stops when remaining games cannot reach the best ones (ties keep ranking order)
+
+        :param ranked_games: a list of game ids
+        :param groups: rated games and default score (or None) of game ids ranked as a group (see get_decision)
+        :param limit: how many results
+        :return: a list of ranked game positions sorted by score
+        """
+        bounds = self.__ranking_scores(ranked_games, groups, self.__upper_bounds())
+        candidates = sorted(range(0, len(ranked_games)), key=bounds.__getitem__, reverse=True)
+
+        # Min heap of best games, the worst one has lowest score and highest position
+        best = []
+        for i in range(0, len(candidates), TOP_RANKING_CHUNK):
+            chunk = candidates[i:i + TOP_RANKING_CHUNK]
+            if (len(best) == limit) and (bounds[chunk[0]] < best[0][0]):
+                break
+
+            chunk_games = [ranked_games[position] for position in chunk]
+            self.__rate_games([e for game_id in chunk_games for e in (groups[game_id][0] if game_id in groups else [game_id])])
+            for position, score in zip(chunk, self.__ranking_scores(chunk_games, groups, self.__evaluations)):
+                entry = (score, -position)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        return [-position for score, position in sorted(best, reverse=True)]
+
+    @profiled('get_decision')
+    def get_decision(self, limit, separate_exp=False, detailed=True):
+        """
+        This method sorts rated games
+
+        :param limit: how many results (None for every result)
+        :param separate_exp: list expansions as separate games
+        :param detailed: add detailed evaluation to suggestions
+        :return: a list of suggestions (see __suggestion), base games have an 'expansions' list unless separate_exp
+        """
+        ranked_games = self.__rating_order
+        groups = {}
+        if not separate_exp:
+            expansion_graph = ExpansionGraph(self.__collection, self.__possible_collection, self.__available_collection)
+            graph = expansion_graph.playable_expansions(len(self.__game_group))
+            nodes = expansion_graph.nodes
+
+            # Base games are ranked with their best expansion, other graph nodes are listed with base games
+            ranked_games = [game_id for game_id in self.__rating_order if (game_id not in nodes) or (game_id in graph)]
+            ranked_games += [game_id for game_id in nodes if (game_id in graph) and (game_id not in self.__possible_collection)]
+            for game_id in graph:
+                if game_id in self.__possible_collection:
+                    groups[game_id] = (graph[game_id], None)
+                else:
+                    groups[game_id] = (graph[game_id][1:], 0.0)
+
+        if limit:
+            positions = self.__top_ranking(ranked_games, groups, limit)
+        else:
+            self.__rate_games(self.__rating_order)
+            ranking_scores = self.__ranking_scores(ranked_games, groups, self.__evaluations)
+            positions = sorted(range(0, len(ranked_games)), key=ranking_scores.__getitem__, reverse=True)
+
+        decision = []
+        for position in positions:
+            game_id = ranked_games[position]
+            if not separate_exp:
+                suggestion = self.__suggestion(game_id, self.__ranking_scores([game_id], groups, self.__evaluations)[0],
+                                               detailed)
+                suggestion['expansions'] = []
+                if game_id in graph:
+                    exps = set(graph[game_id])
+                    for e in exps:
+                        if e == game_id:
                             continue
+                        suggestion['expansions'].append(self.__suggestion(e, detailed=detailed))
+            else:
+                suggestion = self.__suggestion(game_id, detailed=detailed)
+            decision.append(suggestion)
+
+        return decision
+
+    @profiled('show_your_decision')
+    def show_your_decision(self, limit, separate_exp=False):
+        log().info('Game suggestion:')
+        # Detailed evaluations are printed only as debug messages
+        detailed = log().isEnabledFor(logging.DEBUG)
 
-                        log().info('\t\twith expansion %s [%f]' % (self.__collection[e].name, standardize(self.__evaluations[e])))
-                        if e in self.__detailed_evaluations:
-                            log().debug('\t\tDetailed evaluation:')
-                            for key in self.__detailed_evaluations[e]:
-                                log().debug('\t\t%s = %s' % (key, str(self.__detailed_evaluations[e][key])))
-                            log().debug('')
+        if not separate_exp:
+            for suggestion in self.get_decision(limit, separate_exp, detailed):
+                if suggestion['game_score'] is not None:
+                    log().info('\t%s [%f]' % (suggestion['name'], standardize(suggestion['game_score'])))
+                    log().debug('\tDetailed evaluation for base game:')
+                    for key in (suggestion['evaluation'] or {}):
+                        log().debug('\t\t%s = %s' % (key, str(suggestion['evaluation'][key])))
+                    log().debug('')
+                else:
+                    log().info('\t%s (you must use an expansion to play this game)' % suggestion['name'])
+
+                for expansion in suggestion['expansions']:
+                    log().info('\t\twith expansion %s [%f]' % (expansion['name'], standardize(expansion['game_score'])))
+                    log().debug('\t\tDetailed evaluation:')
+                    for key in (expansion['evaluation'] or {}):
+                        log().debug('\t\t%s = %s' % (key, str(expansion['evaluation'][key])))
+                    log().debug('')
         else:
-            sorted_evaluation = sorted(self.__evaluations.items(), key=operator.itemgetter(1), reverse=True)
+            for suggestion in self.get_decision(limit, separate_exp, detailed):
+                log().info('\t%s [%f]' % (suggestion['name'], standardize(suggestion['score'])))
+                for key in (suggestion['evaluation'] or {}):
+                    log().debug('\t\t%s = %s' % (key, str(suggestion['evaluation'][key])))
+
+
+class SuggestionRequestHandler():
+    """
+    Answer queries over HTTP, with GET /suggestions?username=...&guests=... or with POST /suggestions and a JSON query
+    (server must have a session and a create_master function).
+    Used as a mixin of http.server.BaseHTTPRequestHandler, so http.server is imported only by run_server.
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/suggestions':
+            self.__send(404, {'error': 'Not found'})
+            return
+
+        record = {}
+        for key, values in parse_qs(url.query).items():
+            if key in ('username', 'collection'):
+                record[key] = [username for value in values for username in value.split(',')]
+            elif key == 'expansions':
+                record[key] = values[-1].lower() in ('1', 'true', 'yes', 'on')
+            else:
+                record[key] = values[-1]
+        self.__answer(record)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/suggestions':
+            self.__send(404, {'error': 'Not found'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_QUERY_SIZE:
+            self.__send(413, {'error': 'Query too large'})
+            return
+
+        try:
+            record = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self.__send(400, {'error': str(e)})
+            return
+        self.__answer(record)
+
+    def __answer(self, record):
+        """
+        Answer a query and send the result
+
+        :param record: a decoded query
+        """
+        query_id = record.get('id', None) if isinstance(record, dict) else None
+        try:
+            self.server.session.reload_changed()
+            self.__send(200, answer_query(record, self.server.create_master(self.server.session)))
+        except (ValueError, TypeError) as e:
+            self.__send(400, {'id': query_id, 'error': str(e)})
+        except SuggestionError as e:
+            self.__send(422, {'id': query_id, 'error': str(e)})
+        except:
+            log().exception('Cannot answer query %s' % str(record))
+            self.__send(500, {'id': query_id, 'error': 'Internal error'})
+
+    def __send(self, status, result):
+        """
+        Send a JSON response
 
-            if limit:
-                sorted_evaluation = sorted_evaluation[:limit]
+        :param status: HTTP status code
+        :param result: an object to encode
+        """
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-            for game_id, score in sorted_evaluation:
-                log().info('\t%s [%f]' % (self.__collection[game_id].name, standardize(score)))
-                for key in self.__detailed_evaluations[game_id]:
-                    log().debug('\t\t%s = %s' % (key, str(self.__detailed_evaluations[game_id][key])))
+    def log_message(self, format, *args):
+        log().debug('%s - %s' % (self.address_string(), format % args))
 
 # EXECUTION FUNCTIONS
 
@@ -826,31 +3960,404 @@ def __create_and_parse_arguments():
     parser.add_argument('-d', '--debug', help='Print debug messages', action='store_true', default=False)
     parser.add_argument('-l', '--limit', help='Limit to how many results', type=int, default=0)
     parser.add_argument('-f', '--force', help='Re-download all data from BoardGameGeek site', action='store_true', default=False)
+
+    cache_group = parser.add_argument_group('Cache')
+    cache_group.add_argument('--players-ttl', help='Re-download player collections older than given hours (0 to never re-download)', metavar='HOURS', type=float, default=PLAYER_CACHE_TTL / 3600.0)
+    cache_group.add_argument('--games-ttl', help='Re-download games data older than given days (0 to never re-download)', metavar='DAYS', type=float, default=GAME_CACHE_TTL / 86400.0)
+    cache_group.add_argument('-b', '--background-refresh', help='Use stale cached data and re-download it in background', action='store_true', default=False)
+    cache_group.add_argument('--catalog', help='Read games from a catalog snapshot FILE (memory-mapped, so it is shared by processes using it)', metavar='FILE')
+    cache_group.add_argument('--write-catalog', help='Write every cached game to a catalog snapshot FILE and exit', metavar='FILE')
+    cache_group.add_argument('--import', help='Import games into cache from a BGG data dump (CSV file), a saved boardgame xml file or a directory of them and exit, games missing some data are downloaded when used', metavar='FILE', dest='import_path')
+    cache_group.add_argument('--archive', help='Keep every BGG response (compressed) in archive FILE, to rebuild the cache later', metavar='FILE')
+    cache_group.add_argument('--rebuild-cache', help='Parse again every response in archive FILE into the cache and exit', metavar='FILE')
+    cache_group.add_argument('--scores-file', help='Keep players scores of recent game groups in FILE, so next runs with the same players compute them only for changed data', metavar='FILE')
     parser.add_argument('-e', '--expansions', help='List expansion as separate games', action='store_true', default=False)
+    parser.add_argument('--batch', help='Answer every query (a JSON object on each line) in FILE and print results as JSON lines, use - for standard input', metavar='FILE')
+    parser.add_argument('--serve', help='Answer queries on a local HTTP server (GET or POST /suggestions)', metavar='[HOST:]PORT')
+    parser.add_argument('--parse-processes', help='Parse downloaded (or imported) games xml in N worker processes, useful when many games are not cached (0 to parse in this process)', metavar='N', type=int, default=PARSE_PROCESSES)
+    parser.add_argument('--bgg-url', help='Send BGG requests to another server (like a local fake BGG for tests)', metavar='URL')
+    parser.add_argument('--replay', help='Answer BGG requests with responses in archive FILE (no BGG request is made), for tests', metavar='FILE')
+    parser.add_argument('--timing', help='Print how long startup, imports and rating take', action='store_true', default=False)
+    parser.add_argument('--profile', help='Write a JSON report with time and peak memory of every stage and counters (requests, retries, parsed games, cache hits and misses) to FILE, use - for standard error', metavar='FILE')
 
     args = parser.parse_args()
 
+    # Clean and validation
+    if (args.batch is not None) & (args.serve is not None):
+        parser.error('argument --batch & --serve: only one of them can be used')
+
+    if (args.write_catalog is not None) & ((args.batch is not None) | (args.serve is not None)):
+        parser.error('argument --write-catalog: cannot be used with --batch or --serve')
+
+    if (args.import_path is not None) & ((args.batch is not None) | (args.serve is not None) |
+                                         (args.write_catalog is not None)):
+        parser.error('argument --import: cannot be used with --batch, --serve or --write-catalog')
+
+    if (args.rebuild_cache is not None) & ((args.batch is not None) | (args.serve is not None) |
+                                           (args.write_catalog is not None) | (args.import_path is not None)):
+        parser.error('argument --rebuild-cache: cannot be used with --batch, --serve, --write-catalog or --import')
+
+    for filename in (args.rebuild_cache, args.replay):
+        if (filename is not None) and not os.path.isfile(filename):
+            parser.error('argument --rebuild-cache/--replay: %s does not exist' % filename)
+
+    if (args.import_path is not None) and not os.path.exists(args.import_path):
+        parser.error('argument --import: %s does not exist' % args.import_path)
+
+    if (args.batch is None) & (args.serve is None) & (args.write_catalog is None) & (args.import_path is None) & \
+            (args.rebuild_cache is None):
+        error = check_query(args)
+        if error:
+            parser.error(error)
+
+    if args.serve is not None:
+        host, _, port = args.serve.rpartition(':')
+        if not port.isdigit() or (int(port) > 65535):
+            parser.error('argument --serve: invalid port')
+        args.serve = (host or SERVER_HOST, int(port))
+
+    if args.parse_processes < 0:
+        parser.error('argument --parse-processes: N must be a positive value')
+
+    if args.players_ttl < 0.0:
+        parser.error('argument --players-ttl: hours must be a positive value')
+
+    if args.games_ttl < 0.0:
+        parser.error('argument --games-ttl: days must be a positive value')
+
+    return args
+
+
+def check_query(query):
+    """
+    Clean and validate a query (parsed arguments or a batch query)
+
+    :param query: an object with username, guests, collection, time and weight attributes
+    :return: an error message, None if query is valid
+    """
     # Clean
-    if args.username:
-        args.username = [username.strip() for username in args.username if username.strip() != '']
+    if query.username:
+        query.username = [username.strip() for username in query.username if username.strip() != '']
 
-    if args.collection:
-        args.collection = [username.strip() for username in args.collection if username.strip() != '']
+    if query.collection:
+        query.collection = [username.strip() for username in query.collection if username.strip() != '']
 
     # Validation
-    if (args.username is None) & (args.guests <= 0):
-        parser.error('argument -u/--username & -g/--guests: at least one player (or guest) must be specified')
+    if (query.username is None) & (query.guests <= 0):
+        return 'argument -u/--username & -g/--guests: at least one player (or guest) must be specified'
 
-    if (args.username is None) & (args.collection is None):
-        parser.error('argument -u/--username & -c/--collection: at least one BGG username must be specified')
+    if (query.username is None) & (query.collection is None):
+        return 'argument -u/--username & -c/--collection: at least one BGG username must be specified'
 
-    if args.time < 0:
-        parser.error('argument -t/--time: time must be a positive value')
+    if query.time < 0:
+        return 'argument -t/--time: time must be a positive value'
 
-    if (args.weight < 0.0) | (args.weight > 5.0):
-        parser.error('argument -w/--weight: weight must be a value between 0.0 and 5.0')
+    if (query.weight < 0.0) | (query.weight > 5.0):
+        return 'argument -w/--weight: weight must be a value between 0.0 and 5.0'
 
-    return args
+    return None
+
+
+def parse_query(record):
+    """
+    Parse a batch query, a JSON object with the same keys of command line arguments
+    (username, guests, collection, time, weight, limit, expansions) and an optional id
+
+    :param record: a decoded JSON object
+    :return: parsed query (raise ValueError if query is not valid)
+    """
+    if not isinstance(record, dict):
+        raise ValueError('query must be a JSON object')
+
+    def username_list(key):
+        value = record.get(key, None)
+        if value is None:
+            return None
+        return [str(username) for username in ([value] if isinstance(value, str) else value)]
+
+    query = argparse.Namespace(
+        id=record.get('id', None),
+        username=username_list('username'),
+        guests=int(record.get('guests', 0)),
+        collection=username_list('collection'),
+        time=int(record.get('time', 0)),
+        weight=float(record.get('weight', 0.0)),
+        limit=int(record.get('limit', 0)),
+        expansions=bool(record.get('expansions', False))
+    )
+
+    error = check_query(query)
+    if error:
+        raise ValueError(error)
+
+    return query
+
+
+def ask_master(master, query):
+    """
+    Explain a query to master and let him rate games
+
+    :param master: a Master object
+    :param query: parsed arguments or a batch query
+    """
+    # Explain the situation to master
+    if query.username:
+        master.add_known_players(query.username)
+
+    if query.guests > 0:
+        master.add_guests(query.guests)
+
+    if query.collection:
+        # Tell master to use only games from some player / other people
+        master.use_games_owned_by_these_players(query.collection)
+    else:
+        # Tell master to use games owned by players
+        master.use_games_owned_by_these_players(query.username)
+
+    # Tell master to rate every games
+    master.rate_our_games(
+        playing_time=(query.time if query.time > 0 else None),
+        weight=(query.weight if query.weight > 0 else None)
+    )
+
+
+@profiled('query')
+def answer_query(record, master):
+    """
+    Answer a batch (or server) query
+
+    :param record: a decoded JSON query
+    :param master: a Master object
+    :return: a dict with query id and suggestions
+    """
+    query = parse_query(record)
+    ask_master(master, query)
+    return {
+        'id': query.id,
+        'suggestions': master.get_decision(limit=(query.limit if query.limit > 0 else None),
+                                           separate_exp=query.expansions)
+    }
+
+
+def run_batch(input_file, output_file, create_master, session=None):
+    """
+    Answer every query of a JSON lines file, players and games are loaded once and shared between queries
+
+    :param input_file: a file object with a JSON query on every line
+    :param output_file: a file object where results are written (a JSON object for every query)
+    :param create_master: a function that creates a Master object for a given Session
+    :param session: a Session object (None for a new session)
+    :return: how many queries failed
+    """
+    session = session if session is not None else Session()
+    failed = 0
+    for line_number, line in enumerate(input_file, 1):
+        if line.strip() == '':
+            continue
+
+        query_id = None
+        try:
+            record = json.loads(line)
+            query_id = record.get('id', None) if isinstance(record, dict) else None
+            result = answer_query(record, create_master(session))
+        except (ValueError, TypeError) as e:
+            log().error('Invalid query at line %d: %s' % (line_number, e))
+            result = {'id': query_id, 'error': str(e)}
+        except SuggestionError as e:
+            result = {'id': query_id, 'error': str(e)}
+        except:
+            log().exception('Cannot answer query at line %d' % line_number)
+            result = {'id': query_id, 'error': 'Internal error'}
+
+        if 'error' in result:
+            failed += 1
+
+        output_file.write(json.dumps(result) + '\n')
+        output_file.flush()
+
+    return failed
+
+
+def run_server(address, create_master, session=None):
+    """
+    Answer queries over HTTP until interrupted, every cached player and game is kept in memory
+
+    :param address: a tuple with host and port
+    :param create_master: a function that creates a Master object for a given Session
+    :param session: a Session object (None for a new session)
+    """
+    import http.server
+    handler = type('SuggestionHTTPRequestHandler', (SuggestionRequestHandler, http.server.BaseHTTPRequestHandler), {})
+    server = http.server.ThreadingHTTPServer(address, handler)
+    server.daemon_threads = True
+    server.session = session if session is not None else Session()
+    server.session.load_cache()
+    server.create_master = create_master
+
+    log().info('Serving suggestions on http://%s:%d/suggestions' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log().info('Stopping server ..')
+    finally:
+        server.server_close()
+
+
+def write_catalog(filename):
+    """
+    Write every cached game to a catalog snapshot (games are read from cache in chunks)
+
+    :param filename: snapshot filename
+    :return: how many games are written
+    """
+    store = cache_store()
+    game_ids = sorted(store.updated_games(0))
+
+    def cached_games():
+        for i in range(0, len(game_ids), CATALOG_CHUNK_SIZE):
+            chunk = game_ids[i:i + CATALOG_CHUNK_SIZE]
+            games = store.load_games(chunk)
+            for game_id in chunk:
+                if game_id in games:
+                    yield games[game_id]
+
+    count = CatalogSnapshot.write(filename, cached_games())
+    log().info('Written %d games to %s' % (count, filename))
+    return count
+
+
+def read_games_csv(filename, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Read games from a BGG data dump (a CSV file with a header) one batch at a time
+
+    :param filename: a CSV filename
+    :param batch_size: how many games in every batch
+    :return: a generator of dicts of Game objects
+    """
+    with open(filename, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.reader(csv_file)
+        header = [column.strip().lower() for column in next(reader, [])]
+        games = {}
+        for values in reader:
+            g = Game.from_csv_row(dict(zip(header, values)))
+            if g is not None:
+                games[g.game_id] = g
+            if len(games) >= batch_size:
+                yield games
+                games = {}
+        if games:
+            yield games
+
+
+def read_games_xml_files(filenames, workers=IMPORT_WORKERS, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Parse saved BGG boardgame xml files in parallel, at most 2 files for every worker are parsed (or waiting to be
+    collected) at the same time, so memory usage does not depend on how many files there are
+
+    :param filenames: a list of filenames
+    :param workers: how many files are parsed at the same time
+    :param batch_size: games of more files are collected in batches of at least batch_size games
+    :return: a generator of dicts of Game objects
+    """
+    filenames = iter(filenames)
+    games = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = [(filename, executor.submit(Game.get_games_from_xml_file, filename))
+                   for filename in itertools.islice(filenames, workers * 2)]
+        while pending:
+            filename, future = pending.pop(0)
+            for next_filename in itertools.islice(filenames, 1):
+                pending.append((next_filename, executor.submit(Game.get_games_from_xml_file, next_filename)))
+            try:
+                games.update(future.result())
+            except:
+                log().exception('Cannot parse boardgame xml file %s' % filename)
+            if len(games) >= batch_size:
+                yield games
+                games = {}
+    if games:
+        yield games
+
+
+@profiled('import games')
+def import_catalog(path, workers=IMPORT_WORKERS):
+    """
+    Import games into cache from a local file, without any BGG request: a BGG data dump (CSV file), a saved
+    boardgame xml file or a directory of them. While a batch is saved the next one is read.
+
+    :param path: a CSV or xml filename, or a directory of xml files
+    :param workers: how many xml files are parsed at the same time
+    :return: how many games are saved
+    """
+    if os.path.isdir(path):
+        batches = read_games_xml_files(sorted(glob.glob(os.path.join(path, '*.xml'))), workers)
+    elif path.lower().endswith('.xml'):
+        batches = read_games_xml_files([path], workers)
+    else:
+        batches = read_games_csv(path)
+
+    store = cache_store()
+    count = 0
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        saving = None
+        for games in batches:
+            METRICS.count('games_import_read', len(games))
+            if saving is not None:
+                count += saving.result()
+            saving = writer.submit(store.import_games, games)
+        if saving is not None:
+            count += saving.result()
+
+    METRICS.count('games_imported', count)
+    log().info('Imported %d games from %s' % (count, path))
+    return count
+
+
+@profiled('rebuild cache')
+def rebuild_cache(filename):
+    """
+    Parse again every response of an archive into the cache, without any BGG request. Responses are parsed in fetch
+    order (one at a time), so the last response of every game and player is kept and collection changes are merged
+    into the collection downloaded before them.
+
+    :param filename: archive filename
+    :return: how many responses are parsed
+    """
+    archive = ResponseArchive(filename)
+    store = cache_store()
+    count = 0
+    for url, fetched, response in archive.responses():
+        parsed_url = urlparse(url)
+        try:
+            if '/boardgame/' in parsed_url.path:
+                games = Game.parse_games_xml(response.iter_content(XML_CHUNK_SIZE))
+                for g in games.values():
+                    g.updated = fetched
+                store.save_games(games)
+            elif '/collection/' in parsed_url.path:
+                games_stats = Player.get_games_from_xml(response.iter_content(XML_CHUNK_SIZE))
+                if games_stats is None:
+                    continue
+
+                p = Player(urllib.parse.unquote_plus(parsed_url.path.rsplit('/', 1)[1]))
+                cached = None
+                if 'modifiedsince' in parse_qs(parsed_url.query):
+                    cached = store.load_player(p.username)
+                    if cached is None:
+                        log().warning('Collection changes of %s without a collection, skip' % p.username)
+                        continue
+                p.set_games_stats(games_stats, fetched, cached)
+                store.save_player(p)
+            else:
+                log().warning('Unknown url %s, skip' % url)
+                continue
+        except:
+            log().exception('Cannot parse archived response of %s' % url)
+            continue
+        count += 1
+
+    log().info('Parsed %d responses from %s' % (count, filename))
+    return count
 
 
 def setup_log(debug_enable):
@@ -882,56 +4389,102 @@ if __name__ == '__main__':
         print('Python 2.x is not supported, run with Python 3 (python3)')
         exit(1)
 
-    try:
-        import requests
-    except ImportError:
-        print('Missing Requests lib, use \'pip3 install requests\'')
-        exit(1)
-    try:
-        import lxml
-    except ImportError:
-        print('Missin lxml lib, use \'pip3 install lxml\'')
-        exit(1)
-    try:
-       from bs4 import BeautifulSoup
-    except ImportError:
-        print('Missing BeautifulSoup lib, use \'pip3 install beautifulsoup4\'')
-        exit(1)
-    try:
-        import networkx
-    except ImportError:
-        print('Missing NetworkX lib, use \'pip3 install networkx\'')
-        exit(1)
+    # Libs are imported on first use
+    for lib in (requests, etree):
+        if not lib.is_installed():
+            print(lib.missing_message)
+            exit(1)
 
     # Setup
     arguments = __create_and_parse_arguments()
     setup_log(arguments.debug)
+    if arguments.timing:
+        METRICS.enable(log_report_sink)
+    if arguments.profile is not None:
+        METRICS.enable(json_report_sink(arguments.profile))
+    startup = time.time() - process_start_time()
+    METRICS.record('startup', startup)
+    PARSE_PROCESSES = arguments.parse_processes
+
+    def create_master(session=None):
+        return Master(
+            arguments.force,
+            player_ttl=(arguments.players_ttl * 3600 if arguments.players_ttl > 0 else None),
+            game_ttl=(arguments.games_ttl * 86400 if arguments.games_ttl > 0 else None),
+            background_refresh=arguments.background_refresh,
+            session=session
+        )
+
+    if arguments.write_catalog is not None:
+        write_catalog(arguments.write_catalog)
+        exit(0)
+
+    if arguments.import_path is not None:
+        import_catalog(arguments.import_path)
+        METRICS.emit()
+        exit(0)
+
+    if arguments.rebuild_cache is not None:
+        rebuild_cache(arguments.rebuild_cache)
+        METRICS.emit()
+        exit(0)
+
+    if arguments.archive is not None:
+        BGG_SCHEDULER.archive = ResponseArchive(arguments.archive)
+    if arguments.replay is not None:
+        BGG_SCHEDULER.replay = ResponseArchive(arguments.replay)
+    if arguments.bgg_url is not None:
+        BGG_SCHEDULER.transport = HttpTransport(MAX_CONCURRENT_REQUESTS, arguments.bgg_url)
+
+    catalog = None
+    if arguments.catalog is not None:
+        try:
+            catalog = CatalogSnapshot(arguments.catalog)
+        except (OSError, ValueError) as e:
+            log().error('Cannot read catalog snapshot: %s' % e)
+            exit(1)
+
+    session = Session(catalog)
+    if arguments.scores_file is not None:
+        session.players_scores.load(arguments.scores_file)
+
+    exit_code = None
+    try:
+        if arguments.serve is not None:
+            # Answer queries until interrupted
+            run_server(arguments.serve, create_master, session)
+        elif arguments.batch is not None:
+            # Answer every query
+            if arguments.batch == '-':
+                run_batch(sys.stdin, sys.stdout, create_master, session)
+            else:
+                with open(arguments.batch) as batch_file:
+                    run_batch(batch_file, sys.stdout, create_master, session)
+        else:
+            # A query answered from cache should take little more than startup
+            if startup > STARTUP_BUDGET:
+                log().warning('Startup took %.0f ms, over the %.0f ms budget' % (startup * 1000, STARTUP_BUDGET * 1000))
 
-    # Call master
-    master = Master(arguments.force)
+            with METRICS.stage('query'):
+                # Call master
+                master = create_master(session)
+                ask_master(master, arguments)
 
-    # Explain the situation to master
-    if arguments.username:
-        master.add_known_players(arguments.username)
+                # Print master suggestions
+                master.show_your_decision(
+                    limit=(arguments.limit if arguments.limit > 0 else None),
+                    separate_exp=arguments.expansions
+                )
+    except SuggestionError as e:
+        exit_code = e.exit_code
 
-    if arguments.guests > 0:
-        master.add_guests(arguments.guests)
+    # Finish cache refresh before leaving
+    wait_background_refresh()
 
-    if arguments.collection:
-        # Tell master to use only games from some player / other people
-        master.use_games_owned_by_these_players(arguments.collection)
-    else:
-        # Tell master to use games owned by players
-        master.use_games_owned_by_these_players(arguments.username)
+    if arguments.scores_file is not None:
+        session.players_scores.save(arguments.scores_file)
 
-    # Tell master to rate every games
-    master.rate_our_games(
-        playing_time=(arguments.time if arguments.time > 0 else None),
-        weight=(arguments.weight if arguments.weight > 0 else None)
-    )
+    METRICS.emit()
 
-    # Print master suggestions
-    master.show_your_decision(
-        limit=(arguments.limit if arguments.limit > 0 else None),
-        separate_exp=arguments.expansions
-    )
\ No newline at end of file
+    if exit_code is not None:
+        exit(exit_code)